@@ -0,0 +1,54 @@
+"""clip_reduce.py
+
+Time the clip and decimate kernels used by the viewer against the multi-pass
+numpy equivalent, reporting milliseconds per million samples.
+
+    python benchmarks/clip_reduce.py [-n SAMPLES] [-r REPEATS]
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from bulkvis.pyramid import clip_minmax_reduce, clip_signal, minmax_reduce
+
+LOWER, UPPER = -4100, 10000
+
+
+def multi_pass(signal, factor):
+    """Clip then reduce with whole-array intermediates, the approach replaced by the kernels"""
+    outside = (signal < LOWER) | (signal > UPPER)
+    if factor == 1:
+        return np.where(outside, np.iinfo(np.int16).min, signal).astype(np.int16)
+    lo = minmax_reduce(np.where(outside, np.iinfo(np.int16).max, signal), factor)
+    hi = minmax_reduce(np.where(outside, np.iinfo(np.int16).min, signal), factor)
+    return np.stack((lo[:, 0], hi[:, 1]), axis=1)
+
+
+def kernel(signal, factor):
+    if factor == 1:
+        return clip_signal(signal, LOWER, UPPER)
+    return clip_minmax_reduce(signal, factor, LOWER, UPPER)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    parser.add_argument("-n", "--samples", type=int, default=10_000_000)
+    parser.add_argument("-r", "--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    signal = rng.normal(600, 2500, args.samples).astype(np.int16)
+    per_million = 1e3 * 1e6 / args.samples
+    print(f"{args.samples:,} int16 samples, best of {args.repeats}, ms per million samples")
+    print(f"{'factor':>8} {'kernel':>10} {'multi-pass':>12}")
+    for factor in [1, 16, 256, 4096]:
+        times = []
+        for fn in (kernel, multi_pass):
+            t = timeit.repeat(lambda: fn(signal, factor), number=1, repeat=args.repeats)
+            times.append(min(t) * per_million)
+        print(f"{factor:>8} {times[0]:>10.2f} {times[1]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
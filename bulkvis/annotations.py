@@ -0,0 +1,359 @@
+"""annotations.py
+
+Sorted, per-channel, index of the IntermediateData and StateData annotations
+in a bulk FAST5 file
+"""
+import sys
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from bulkvis.bulkfile import refresh_dataset
+
+READ_FIELDS = ["read_id", "read_start", "modal_classification"]
+STATE_FIELDS = ["acquisition_raw_index", "summary_state"]
+
+
+def enum_labels(dataset, field):
+    """Return {code: name} for an enumerated field of a compound dataset"""
+    mapping = h5py.check_dtype(enum=dataset.dtype[field])
+    if not mapping:
+        return {}
+    # codes may lose some names if there are duplicate values
+    return {v: k for k, v in mapping.items()}
+
+
+class ChannelAnnotations:
+    """Annotation events of one channel, sorted by time
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Event times in seconds, sorted ascending
+    codes : numpy.ndarray
+        Classification code of each event
+    read_ids : numpy.ndarray
+        Read id of each event as bytes, empty for state events
+    labels : dict
+        {code: name} for the classification codes
+    rows : dict
+        {name: rows read} of the Reads and States datasets, see extend_channel_annotations
+    """
+
+    def __init__(self, times, codes, read_ids, labels, rows=None):
+        self.times = times
+        self.codes = codes
+        self.read_ids = read_ids
+        self.labels = labels
+        self.rows = rows or {}
+        self.by_code = {code: times[codes == code] for code in np.unique(codes)}
+
+    def __len__(self):
+        return len(self.times)
+
+    def window(self, start, end):
+        """Return the (lo, hi) slice of events with start <= time <= end"""
+        lo = np.searchsorted(self.times, start, side="left")
+        hi = np.searchsorted(self.times, end, side="right")
+        return lo, hi
+
+    def next_event(self, code, after):
+        """Return the time of the first event of a classification after a time, or None"""
+        times = self.by_code.get(code)
+        if times is None:
+            return None
+        i = np.searchsorted(times, after, side="right")
+        return times[i] if i < len(times) else None
+
+    def previous_event(self, code, before):
+        """Return the time of the last event of a classification before a time, or None"""
+        times = self.by_code.get(code)
+        if times is None:
+            return None
+        i = np.searchsorted(times, before, side="left") - 1
+        return times[i] if i >= 0 else None
+
+    def label_text(self, lo, hi):
+        """Return the label for each event in a slice as 'classification - read_id'"""
+        text = []
+        for code, read_id in zip(self.codes[lo:hi], self.read_ids[lo:hi]):
+            name = self.labels.get(code, str(code))
+            if read_id:
+                text.append("{n} - {r}".format(n=name, r=read_id.decode("utf8")))
+            else:
+                text.append(name)
+        return np.array(text, dtype=object)
+
+
+def event_bins(times, codes, start, end, n_bins):
+    """Count the events of each classification in equal width time bins
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Event times, events outside [start, end] are counted in the first or last bin
+    codes : numpy.ndarray
+        Integer classification code of each event
+    start, end : float
+        Time range covered by the bins
+    n_bins : int
+        Number of bins
+    Returns
+    -------
+    tuple
+        (bins, codes, counts) arrays with one entry per occupied (bin, code)
+        pair, sorted by bin then code
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    if not len(times):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    width = max(end - start, 1e-9) / n_bins
+    bins = np.clip(((np.asarray(times) - start) // width).astype(np.int64), 0, n_bins - 1)
+    low = codes.min()
+    span = codes.max() - low + 1
+    keys, counts = np.unique(bins * span + (codes - low), return_counts=True)
+    return keys // span, keys % span + low, counts
+
+
+def bin_label_text(bins, codes, counts, labels):
+    """Return (bins, text) with one label per occupied bin, e.g. 'strand x12, pore x3'
+    Parameters
+    ----------
+    bins, codes, counts : numpy.ndarray
+        As returned by event_bins
+    labels : dict
+        {code: name} for the classification codes
+    """
+    occupied, first = np.unique(bins, return_index=True)
+    text = [
+        ", ".join(
+            "{n} x{c}".format(n=labels.get(code, str(code)), c=count)
+            for code, count in zip(codes[lo:hi], counts[lo:hi])
+        )
+        for lo, hi in zip(first, np.append(first[1:], len(bins)))
+    ]
+    return occupied, np.array(text, dtype=object)
+
+
+def _annotation_source(bulkfile, sidecar, group, channel_str, name):
+    """Return the annotation dataset, preferring the sorted copy in a sidecar"""
+    if sidecar is not None:
+        try:
+            return sidecar["Annotations"][channel_str][name]
+        except KeyError:
+            pass
+    try:
+        return bulkfile[group][channel_str][name]
+    except KeyError:
+        return None
+
+
+def _read_events(data, sf):
+    """Return (times, codes, read_ids) of Reads rows"""
+    return (
+        data["read_start"] / sf,
+        data["modal_classification"].astype(np.int64),
+        data["read_id"].astype(object),
+    )
+
+
+def _state_events(data, sf):
+    """Return (times, codes, read_ids) of States rows"""
+    return (
+        data["acquisition_raw_index"] / sf,
+        data["summary_state"].astype(np.int64),
+        np.full(len(data), b"", dtype=object),
+    )
+
+
+def _sorted_annotations(events, labels, rows):
+    """Return ChannelAnnotations of (times, codes, read_ids) tuples sorted by time"""
+    if not events:
+        empty = np.empty(0)
+        return ChannelAnnotations(empty, empty.astype(np.int64), empty, labels, rows)
+    times = np.concatenate([e[0] for e in events])
+    order = np.argsort(times, kind="stable")
+    return ChannelAnnotations(
+        times[order],
+        np.concatenate([e[1] for e in events])[order],
+        np.concatenate([e[2] for e in events])[order],
+        labels,
+        rows,
+    )
+
+
+def load_channel_annotations(bulkfile, channel_str, sf, sidecar=None):
+    """Return the ChannelAnnotations for a channel
+    Only the fields needed for plotting and navigation are read. Reads are
+    de-duplicated on (read_id, modal_classification), keeping the first.
+    Parameters
+    ----------
+    bulkfile : h5py.File
+        An open bulk FAST5 file
+    channel_str : str
+        Channel group name, e.g. 'Channel_1'
+    sf : int
+        Sample frequency, used to convert sample indexes to seconds
+    sidecar : h5py.File or None
+        An open sidecar file built by `bulkvis index`
+    Returns
+    -------
+    ChannelAnnotations
+    """
+    events = []
+    labels = {}
+    rows = {}
+    reads = _annotation_source(
+        bulkfile, sidecar, "IntermediateData", channel_str, "Reads"
+    )
+    if reads is not None:
+        data = reads.fields(READ_FIELDS)[()]
+        rows["Reads"] = len(data)
+        dup = pd.DataFrame(
+            {"r": data["read_id"], "c": data["modal_classification"]}
+        ).duplicated(keep="first")
+        events.append(_read_events(data[~dup.values], sf))
+        labels.update(enum_labels(reads, "modal_classification"))
+    states = _annotation_source(
+        bulkfile, sidecar, "StateData", channel_str, "States"
+    )
+    if states is not None:
+        data = states.fields(STATE_FIELDS)[()]
+        rows["States"] = len(data)
+        events.append(_state_events(data, sf))
+        labels.update(enum_labels(states, "summary_state"))
+    return _sorted_annotations(events, labels, rows)
+
+
+def extend_channel_annotations(bulkfile, channel_str, sf, annotations):
+    """Return annotations with the rows added to a bulk file since they were read
+
+    Only the new rows of the Reads and States datasets are read, refreshing
+    their extents first if the file is open in SWMR mode. New reads already
+    present with the same classification are skipped, as in
+    load_channel_annotations. The annotations given are not modified.
+    Parameters
+    ----------
+    bulkfile : h5py.File
+        An open bulk FAST5 file
+    channel_str : str
+        Channel group name, e.g. 'Channel_1'
+    sf : int
+        Sample frequency, used to convert sample indexes to seconds
+    annotations : ChannelAnnotations
+        Annotations returned by load_channel_annotations or this function
+    Returns
+    -------
+    ChannelAnnotations
+        The annotations given if no rows have been added
+    """
+    events = []
+    rows = dict(annotations.rows)
+    for group, name in [("IntermediateData", "Reads"), ("StateData", "States")]:
+        try:
+            ds = refresh_dataset(bulkfile[group][channel_str][name])
+        except KeyError:
+            continue
+        start = rows.get(name, 0)
+        if ds.shape[0] <= start:
+            continue
+        rows[name] = ds.shape[0]
+        if name == "Reads":
+            data = ds.fields(READ_FIELDS)[start:]
+            seen = pd.MultiIndex.from_arrays(
+                [annotations.read_ids, annotations.codes]
+            )
+            new = pd.MultiIndex.from_arrays(
+                [data["read_id"].astype(object), data["modal_classification"]]
+            )
+            keep = ~(new.isin(seen) | new.duplicated(keep="first"))
+            events.append(_read_events(data[keep], sf))
+        else:
+            events.append(_state_events(ds.fields(STATE_FIELDS)[start:], sf))
+    if not events:
+        return annotations
+    events.append((annotations.times, annotations.codes, annotations.read_ids))
+    return _sorted_annotations(events, annotations.labels, rows)
+
+
+READ_INDEX_DTYPE = np.dtype(
+    [("read_id", "S36"), ("channel", "u4"), ("start", "u8"), ("end", "u8")]
+)
+
+
+class ReadIndex:
+    """Hashed index of read_id to (channel, start sample, end sample) for a bulk file
+    Parameters
+    ----------
+    rows : numpy.ndarray
+        Structured array with the fields of READ_INDEX_DTYPE, read ids must be unique
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self._index = pd.Index(rows["read_id"])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, read_id):
+        """Return (channel, start, end) for a read id, or None if it is not in the file"""
+        if isinstance(read_id, str):
+            read_id = read_id.encode("utf8")
+        try:
+            row = self.rows[self._index.get_loc(read_id)]
+        except KeyError:
+            return None
+        return int(row["channel"]), int(row["start"]), int(row["end"])
+
+
+def read_index_rows(data, channel):
+    """Return READ_INDEX_DTYPE rows spanning the first to last entry of each read
+    Parameters
+    ----------
+    data : numpy.ndarray
+        IntermediateData Reads with at least the read_id and read_start fields
+    channel : int
+        Channel number of the reads
+    Returns
+    -------
+    numpy.ndarray
+    """
+    ids, first = np.unique(data["read_id"], return_index=True)
+    _, last = np.unique(data["read_id"][::-1], return_index=True)
+    last = len(data) - 1 - last
+    rows = np.empty(len(ids), dtype=READ_INDEX_DTYPE)
+    rows["read_id"] = ids
+    rows["channel"] = channel
+    rows["start"] = data["read_start"][first]
+    rows["end"] = data["read_start"][last]
+    return rows
+
+
+def build_read_index_rows(bulkfile, sidecar=None):
+    """Return READ_INDEX_DTYPE rows for every read in every channel of a bulk file"""
+    rows = []
+    for channel_str in bulkfile["IntermediateData"]:
+        reads = _annotation_source(
+            bulkfile, sidecar, "IntermediateData", channel_str, "Reads"
+        )
+        if reads is None:
+            continue
+        data = reads.fields(["read_id", "read_start"])[()]
+        rows.append(read_index_rows(data, int(channel_str.split("_")[-1])))
+    if not rows:
+        return np.empty(0, dtype=READ_INDEX_DTYPE)
+    rows = np.concatenate(rows)
+    _, unique = np.unique(rows["read_id"], return_index=True)
+    return rows[np.sort(unique)]
+
+
+def load_read_index(bulkfile, sidecar=None):
+    """Return the ReadIndex of a bulk file, from its sidecar if it has one"""
+    if sidecar is not None and "ReadIndex" in sidecar:
+        return ReadIndex(sidecar["ReadIndex"][()])
+    return ReadIndex(build_read_index_rows(bulkfile, sidecar))
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: annotations is not directly executable")
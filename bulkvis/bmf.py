@@ -0,0 +1,93 @@
+"""bmf.py
+
+Load bulkvis mapping files (.bmf), written by `bulkvis mappings`, into a
+per-channel interval index for drawing mappings in the viewer
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+BMF_COLUMNS = ["run_id", "channel", "start_time", "end_time", "strand", "label"]
+
+
+class ChannelMappings:
+    """Mappings on one channel sorted by start time, with label lanes assigned
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Mappings for a single channel with the columns in BMF_COLUMNS
+    """
+
+    def __init__(self, df):
+        df = df.sort_values(by=["start_time", "end_time"], kind="stable")
+        self.start = df["start_time"].values
+        self.end = df["end_time"].values
+        self.strand = df["strand"].values
+        self.label = df["label"].values
+        # Mappings with the same start and end are stacked in separate lanes
+        self.lane = df.groupby(["start_time", "end_time"]).cumcount().values
+        # Running maximum of end times, bounds the search for overlaps
+        self._max_end = np.maximum.accumulate(self.end) if len(self.end) else self.end
+
+    def __len__(self):
+        return len(self.start)
+
+    def overlapping(self, start, end):
+        """Return the indices of mappings that overlap the interval (start, end)
+        Mappings are sorted by start so the candidates are found by binary
+        search, only those in that range are compared to `start`.
+        """
+        hi = np.searchsorted(self.start, end, side="left")
+        lo = np.searchsorted(self._max_end, start, side="right")
+        if hi <= lo:
+            return np.empty(0, dtype=np.int64)
+        idx = np.arange(lo, hi)
+        return idx[self.end[lo:hi] > start]
+
+
+class MappingIndex:
+    """Mappings for a run partitioned by channel
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Mappings with the columns in BMF_COLUMNS
+    """
+
+    def __init__(self, df):
+        self.channels = {
+            int(channel): ChannelMappings(group)
+            for channel, group in df.groupby("channel", sort=False)
+        }
+        self._empty = ChannelMappings(df.iloc[0:0])
+
+    def __len__(self):
+        return sum(len(m) for m in self.channels.values())
+
+    def channel(self, channel):
+        """Return the ChannelMappings for a channel number, empty if it has none"""
+        return self.channels.get(int(channel), self._empty)
+
+
+def read_bmf(path, run_id):
+    """Return a MappingIndex of the mappings in a .bmf file for one run
+    Parameters
+    ----------
+    path : str
+        Path to a <run_id>.bmf file
+    run_id : str
+        Only mappings from this run are kept
+    Returns
+    -------
+    MappingIndex
+    Raises
+    ------
+    FileNotFoundError
+        If the bmf file does not exist
+    """
+    df = pd.read_csv(path, sep="\t", usecols=BMF_COLUMNS)
+    return MappingIndex(df[df["run_id"] == run_id])
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: bmf is not directly executable")
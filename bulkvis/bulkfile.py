@@ -0,0 +1,150 @@
+"""bulkfile.py
+
+Windowed access to the raw signal held in ONT bulk FAST5 files
+"""
+import math
+import os
+import sys
+
+import h5py
+import numpy as np
+
+# Samples per cached chunk of decoded signal
+CHUNK_SAMPLES = 2 ** 18
+
+
+def channel_name(channel):
+    """Return the HDF5 group name for a channel number, e.g. 'Channel_1'"""
+    return "Channel_{ch}".format(ch=channel)
+
+
+def open_bulk(path):
+    """Open a bulk FAST5 file read-only, in SWMR mode where the file allows it
+
+    In SWMR mode datasets of a file that is still being written can be
+    refreshed to see new data, see refresh_dataset.
+    """
+    try:
+        bulkfile = h5py.File(path, "r", swmr=True)
+    except (OSError, ValueError):
+        bulkfile = h5py.File(path, "r")
+    file_version(bulkfile)
+    return bulkfile
+
+
+def file_version(bulkfile):
+    """Return the (size, mtime_ns) of the file behind an open h5py.File
+    Recorded on first use, open_bulk records it when opening, so a handle keeps
+    the version of the file it reads even once the file on disk is replaced.
+    """
+    version = getattr(bulkfile, "_bulkvis_version", None)
+    if version is None:
+        st = os.stat(bulkfile.filename)
+        version = bulkfile._bulkvis_version = (st.st_size, st.st_mtime_ns)
+    return version
+
+
+def refresh_dataset(dataset):
+    """Update the extent of a dataset from disk if its file is open in SWMR mode"""
+    if dataset.file.swmr_mode:
+        dataset.refresh()
+    return dataset
+
+
+def signal_dataset(bulkfile, channel_str):
+    """Return the h5py.Dataset holding the raw signal for a channel
+    Parameters
+    ----------
+    bulkfile : h5py.File
+        An open bulk FAST5 file
+    channel_str : str
+        Channel group name, e.g. 'Channel_1'
+    Returns
+    -------
+    h5py.Dataset
+    """
+    return bulkfile["Raw"][channel_str]["Signal"]
+
+
+def signal_length(bulkfile, channel_str):
+    """Return the number of samples in a channel, read from the dataset metadata
+    Parameters
+    ----------
+    bulkfile : h5py.File
+        An open bulk FAST5 file
+    channel_str : str
+        Channel group name, e.g. 'Channel_1'
+    Returns
+    -------
+    int
+    """
+    return signal_dataset(bulkfile, channel_str).shape[0]
+
+
+def read_signal(bulkfile, channel_str, start, end, margin=0, cache=None):
+    """Return a window of raw signal, reading only the requested samples from disk
+    Parameters
+    ----------
+    bulkfile : h5py.File
+        An open bulk FAST5 file
+    channel_str : str
+        Channel group name, e.g. 'Channel_1'
+    start : int
+        Index of the first sample requested
+    end : int
+        Index one past the last sample requested
+    margin : int
+        Extra samples to read either side of the window, clipped to the dataset
+    cache : bulkvis.cache.ChunkCache or None
+        If given, the window is assembled from cached chunks of CHUNK_SAMPLES
+        samples and only missing chunks are read from disk
+    Returns
+    -------
+    offset : int
+        Index of the first sample returned
+    signal : numpy.ndarray
+        Samples [offset, offset + len(signal)) of the channel
+    """
+    dataset = signal_dataset(bulkfile, channel_str)
+    offset = max(int(start) - int(margin), 0)
+    stop = min(int(end) + int(margin), dataset.shape[0])
+    if stop <= offset:
+        return offset, dataset[0:0]
+    if cache is None:
+        return offset, dataset[offset:stop]
+    first_chunk = offset // CHUNK_SAMPLES
+    last_chunk = (stop - 1) // CHUNK_SAMPLES
+    chunks = [
+        read_chunk(bulkfile, channel_str, i, cache)
+        for i in range(first_chunk, last_chunk + 1)
+    ]
+    base = first_chunk * CHUNK_SAMPLES
+    if len(chunks) == 1:
+        return offset, chunks[0][offset - base : stop - base]
+    return offset, np.concatenate(chunks)[offset - base : stop - base]
+
+
+def read_chunk(bulkfile, channel_str, index, cache):
+    """Return chunk `index` of a channel's signal, from the cache or from disk
+    Chunks are cached under the key (file name, file version, channel, chunk
+    index), see file_version, so a file replaced on disk and reopened is never
+    served chunks of its old contents. The last chunk is only cached once it
+    is full, as a file being written may still be adding to it.
+    """
+    key = (bulkfile.filename, file_version(bulkfile), channel_str, index)
+    chunk = cache.get(key)
+    if chunk is None:
+        dataset = signal_dataset(bulkfile, channel_str)
+        chunk = dataset[index * CHUNK_SAMPLES : (index + 1) * CHUNK_SAMPLES]
+        if len(chunk) == CHUNK_SAMPLES:
+            cache.put(key, chunk)
+    return chunk
+
+
+def window_margin(n_samples, fraction=0.005):
+    """Return the margin, in samples, to read either side of a window of n_samples"""
+    return int(math.ceil(n_samples * fraction))
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: bulkfile is not directly executable")
@@ -26,7 +26,7 @@ def main():
     parser.add_argument("--version", action="version", version=version)
     subparsers = parser.add_subparsers(dest="command", help="Sub-commands")
 
-    for module in ["fuse", "merge", "serve", "mappings", "cite"]:
+    for module in ["fuse", "merge", "serve", "mappings", "index", "stats", "cite"]:
         _module = importlib.import_module(f"bulkvis.{module}")
         _parser = subparsers.add_parser(
             module, description=_module._help, help=_module._help
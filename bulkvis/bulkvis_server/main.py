@@ -1,5 +1,7 @@
 import configparser
+from concurrent.futures import ThreadPoolExecutor
 from dateutil import parser
+from functools import partial
 import math
 from pathlib import Path
 import re
@@ -11,6 +13,7 @@ from collections import OrderedDict
 import h5py
 import numpy as np
 import pandas as pd
+from bokeh.events import Tap
 from bokeh.layouts import row, column
 from bokeh.models import (
     TextInput,
@@ -30,8 +33,47 @@ from bokeh.models import (
     Select,
     Button,
     ColumnDataSource,
+    CustomJSTransform,
+    ColorBar,
+    HoverTool,
+    LinearColorMapper,
 )
+from bokeh.palettes import Viridis256
 from bokeh.plotting import curdoc, figure
+from bokeh.transform import transform
+
+from bulkvis.annotations import (
+    bin_label_text,
+    event_bins,
+    extend_channel_annotations,
+    load_channel_annotations,
+    load_read_index,
+)
+from bulkvis.bmf import read_bmf as read_bmf_index
+from bulkvis.bulkfile import (
+    open_bulk,
+    read_signal,
+    refresh_dataset,
+    signal_dataset,
+    signal_length,
+    window_margin,
+)
+from bulkvis.cache import shared_cache
+from bulkvis.handles import shared_pool
+from bulkvis.readahead import ReadAhead
+from bulkvis.stack import parse_channels, shared_reader
+from bulkvis.catalogue import BULKFILE_ATTRIBUTES, load_catalogue, read_metadata
+from bulkvis.overview import flowcell_activity
+from bulkvis.stats import window_limits
+from bulkvis.pyramid import (
+    budget_level,
+    choose_level,
+    open_sidecar,
+    read_window,
+    sidecar_path,
+    signal_limits,
+    SIGNAL_GAP,
+)
 
 
 def export_read_file(channel, start_index, end_index, bulkfile, output_dir):
@@ -116,8 +158,7 @@ def export_read_file(channel, start_index, end_index, bulkfile, output_dir):
         "start_time": {"val": start_index, "d": "uint64"},
     }
 
-    dataset = bulkfile["Raw"][ch_str]["Signal"][()]
-    dataset = dataset[start_index:end_index]
+    _, dataset = read_signal(bulkfile, ch_str, start_index, end_index)
 
     readfile.create_group("Raw/Reads/Read_{n}".format(n=read_number))
     readfile.attrs.create("file_version", version_num, None, dtype="Float64")
@@ -168,6 +209,27 @@ label_height = 750
 upper_cut_off = 10000
 lower_cut_off = -4100
 output_backend = canvas
+zoom_points = 20000
+zoom_delay_ms = 250
+label_px = 15
+
+[cache]
+signal_mb = 512
+read_ahead = 8
+handle_idle_seconds = 300
+read_ahead_workers = 2
+
+[live]
+refresh_ms = 2000
+
+[stack]
+workers = 4
+max_channels = 32
+min_height = 80
+
+[overview]
+bins = 200
+state = strand
 
 [labels]
 adapter = True
@@ -182,6 +244,10 @@ config.read_file(io.StringIO(cfg))
 cfg_po = config["plot_opts"]
 cfg_dr = config["data"]
 cfg_lo = config["labels"]
+cfg_ca = config["cache"]
+cfg_li = config["live"]
+cfg_st = config["stack"]
+cfg_ov = config["overview"]
 output_backend = {"canvas", "svg", "webgl"}
 
 """
@@ -209,11 +275,41 @@ def init_wdg_dict():
     return wdg_dict
 
 
+def load_file_lists(directory, map_directory):
+    """Return the catalogue and the bulk and bmf file options, on the load thread
+
+    Files are checked to be useable by h5py, re-probing only files changed
+    since the last session, see bulkvis.catalogue.load_catalogue.
+    """
+    catalogue = load_catalogue(directory)
+    files = [(name, name) for name, entry in catalogue.items() if entry["valid"]]
+    map_files = [
+        (x.name, x.name) for x in Path(map_directory).iterdir() if x.suffix == ".bmf"
+    ]
+    return catalogue, [("", "--")] + files, [("", "--")] + map_files
+
+
+def apply_file_lists(lists):
+    """Offer the files found by load_file_lists in the file selector"""
+    catalogue, files, map_files = lists
+    app_data["app_vars"]["catalogue"] = catalogue
+    app_data["app_vars"]["files"] = files
+    app_data["app_vars"]["map_files"] = map_files
+    app_data["wdg_dict"]["file_list"].options = files
+    app_data["wdg_dict"]["file_list"].disabled = False
+
+
 def update_file(attr, old, new):
     """"""
-    if app_data["bulkfile"]:
-        app_data["bulkfile"].flush()
-        app_data["bulkfile"].close()
+    # Drop requests for the old file, then close it once the load thread is idle
+    if app_data.get("live") is not None:
+        doc.remove_periodic_callback(app_data["live"])
+    pending_requests.clear()
+    read_ahead.clear()
+    show_loading()
+    load_executor.submit(release_files, app_data["bulkfile"], app_data.get("sidecar"))
+    app_data["bulkfile"] = None
+    app_data["sidecar"] = None
 
     if new == "":
         app_data["wdg_dict"] = init_wdg_dict()
@@ -232,42 +328,96 @@ def update_file(attr, old, new):
     file_wdg = app_data["wdg_dict"]["file_list"]
     file_list = app_data["app_vars"]["files"]
     map_file_list = app_data["app_vars"]["map_files"]
+    catalogue = app_data["app_vars"]["catalogue"]
     # Clear old bulkfile data and build new data structures
     app_data.clear()
+    app_data["bulkfile"] = None
+    app_data["sidecar"] = None
     app_data["app_vars"] = {}
     app_data["wdg_dict"] = OrderedDict()
     app_data["label_dt"] = OrderedDict()
+    app_data["annotation_index"] = {}
+    app_data["read_index"] = None
+    app_data["live"] = None
+    app_data["overview"] = None
     app_data["file_src"] = Path(Path(cfg_dr["dir"]) / file_src)
     app_data["INIT"] = True
     app_data["app_vars"]["files"] = file_list
     app_data["app_vars"]["map_files"] = map_file_list
+    app_data["app_vars"]["catalogue"] = catalogue
+    # Only the file selector is shown until the file is open
+    app_data["wdg_dict"]["file_list"] = file_wdg
+    layout.children[0] = column([file_wdg], width=int(cfg_po["wdg_width"]))
+    run_async(
+        "file",
+        partial(load_file, app_data["file_src"], catalogue.get(file_src)),
+        apply_file,
+        discard=release_loaded_file,
+    )
+
+
+def load_file(file_src, entry):
+    """Open a bulk file and its sidecar from the shared handle pool on the load thread
+    Parameters
+    ----------
+    file_src : pathlib.Path
+        Bulk FAST5 file
+    entry : dict or None
+        Catalogue entry of the file, its metadata is read from the file if None
+    Returns
+    -------
+    dict
+        The open 'bulkfile' and 'sidecar' (or None), the catalogue 'entry' and
+        the signal length of the file in 'samples'
+    """
+    bulkfile = handle_pool.acquire(file_src, open_bulk)
+    try:
+        # get dataset length from the catalogue where possible
+        if entry is None:
+            entry = read_metadata(bulkfile)
+            samples = signal_length(bulkfile, next(iter(bulkfile["Raw"])))
+        else:
+            samples = entry["signal_length"]
+        sidecar = handle_pool.acquire(
+            sidecar_path(file_src), partial(open_sidecar_for, file_src)
+        )
+    except Exception:
+        handle_pool.release(bulkfile)
+        raise
+    return {"bulkfile": bulkfile, "sidecar": sidecar, "entry": entry, "samples": samples}
+
 
-    (
-        app_data["bulkfile"],
-        app_data["app_vars"]["sf"],
-        app_data["app_vars"]["attributes"],
-    ) = open_bulkfile(app_data["file_src"])
+def release_loaded_file(loaded):
+    """Release the handles of a load_file result that was superseded"""
+    if loaded is not None:
+        release_files(loaded["bulkfile"], loaded["sidecar"])
 
-    raw_path = app_data["bulkfile"]["Raw"]
-    for i, member in enumerate(raw_path):
-        if i == 0:
-            signal_ds = raw_path[member]["Signal"][()]
-            # get dataset length in seconds
-            # app_data['app_vars']['len_ds'] = math.ceil(len(signal_ds) / app_data['app_vars']['sf'])
-            app_data["app_vars"]["len_ds"] = len(signal_ds) / app_data["app_vars"]["sf"]
+
+def apply_file(loaded):
+    """Show the position inputs for a file opened by load_file and start its overview"""
+    app_data["bulkfile"] = loaded["bulkfile"]
+    app_data["sidecar"] = loaded["sidecar"]
+    LOGGER.info(f"Bulk file handles: {handle_pool}")
+    entry = loaded["entry"]
+    # Get sample frequency, how many data points are collected each second
+    app_data["app_vars"]["sf"] = entry["sample_frequency"]
+    app_data["app_vars"]["attributes"] = BULKFILE_ATTRIBUTES
+    app_data["app_vars"].update(file_attributes(entry))
+    app_data["app_vars"]["len_ds"] = loaded["samples"] / app_data["app_vars"]["sf"]
 
     # add fastq and position inputs
+    file_wdg = app_data["wdg_dict"]["file_list"]
     app_data["wdg_dict"] = init_wdg_dict()
     app_data["wdg_dict"]["file_list"] = file_wdg
     # app_data['wdg_dict']['maps_list'] = Select(title="Select mapping file:", options=map_file_list)
     # app_data['wdg_dict']['position_label'] = Div(text='Position', css_classes=['position-dropdown', 'help-text'])
     app_data["wdg_dict"]["position_text"] = Div(
-        text="""Enter a position in your bulk FAST5 file as <code>channel:start-end</code> or a <code>complete FASTQ header</code>.""",
+        text="""Enter a position in your bulk FAST5 file as <code>channel:start-end</code>, a <code>read id</code> or a <code>complete FASTQ header</code>.""",
         css_classes=["position-drop"],
     )
     app_data["wdg_dict"]["position"] = TextInput(
         value="",
-        placeholder="e.g 391:120-150 or complete FASTQ header",
+        placeholder="e.g 391:120-150, read id or complete FASTQ header",
         css_classes=["position-label"],
     )
     read_bmf(app_data["app_vars"]["Run ID"])
@@ -276,123 +426,235 @@ def update_file(attr, old, new):
     layout.children[0] = column(
         list(app_data["wdg_dict"].values()), width=int(cfg_po["wdg_width"])
     )
+    request_overview()
+
+
+def request_overview():
+    """Compute the flowcell activity of the file on the load thread, then show it"""
+    app_vars = app_data["app_vars"]
+    run_async(
+        "overview",
+        partial(
+            flowcell_activity,
+            app_data["file_src"],
+            app_data["bulkfile"],
+            math.floor(app_vars["len_ds"] * app_vars["sf"]),
+            int(cfg_ov["bins"]),
+            stack_reader,
+        ),
+        apply_overview,
+    )
+
+
+def apply_overview(activity):
+    """Build the heatmap of the flowcell, showing it if no position is shown yet"""
+    if not len(activity) or not activity.labels:
+        # No channels or no StateData, there is nothing to draw
+        return
+    app_data["overview"] = create_overview(activity)
+    if app_data["INIT"]:
+        layout.children[1] = app_data["overview"]["root"]
+
+
+def create_overview(activity):
+    """Return a heatmap of the fraction of time each channel spends in a state
+
+    Rows are channels and columns time bins, tapping a cell shows that
+    channel and bin.
+    """
+    sf = app_data["app_vars"]["sf"]
+    labels = list(activity.labels)
+    state = cfg_ov["state"] if cfg_ov["state"] in labels else labels[0]
+    source = ColumnDataSource(data=dict(image=[activity.grid(state)]))
+    first, last = int(activity.channels[0]), int(activity.channels[-1])
+    end_time = float(activity.edges[-1]) / sf
+    p = figure(
+        plot_height=int(cfg_po["plot_height"]),
+        plot_width=int(cfg_po["plot_width"]),
+        toolbar_location="right",
+        tools=["box_zoom", "reset", "save"],
+        x_range=Range1d(0, end_time, bounds=(0, end_time)),
+        y_range=Range1d(first - 0.5, last + 0.5, bounds=(first - 0.5, last + 0.5)),
+    )
+    p.toolbar.logo = None
+    p.add_layout(
+        Title(
+            text="Channel activity: {s}".format(
+                s=app_data["wdg_dict"]["file_list"].value
+            )
+        ),
+        "above",
+    )
+    p.xaxis.axis_label = "Time (seconds)"
+    p.yaxis.axis_label = "Channel"
+    mapper = LinearColorMapper(palette=Viridis256, low=0, high=1, nan_color="white")
+    p.image(
+        image="image",
+        source=source,
+        x=0,
+        y=first - 0.5,
+        dw=end_time,
+        dh=last - first + 1,
+        color_mapper=mapper,
+    )
+    p.add_layout(ColorBar(color_mapper=mapper, title="Fraction"), "right")
+    p.add_tools(
+        HoverTool(
+            tooltips=[
+                ("Channel", "$y{0}"),
+                ("Time (s)", "$x{0}"),
+                ("Fraction", "@image{0.00}"),
+            ]
+        )
+    )
+    p.on_event(Tap, overview_tap)
+    select_state = Select(title="Fraction of time in state:", value=state, options=labels)
+    select_state.on_change(
+        "value", lambda attr, old, new: source.data.update(image=[activity.grid(new)])
+    )
+    return {
+        "activity": activity,
+        "source": source,
+        "root": column(select_state, p, css_classes=["plot_div"]),
+    }
+
+
+def show_overview():
+    """Show the flowcell heatmap in place of the plot"""
+    if app_data.get("overview") is not None:
+        layout.children[1] = app_data["overview"]["root"]
+
+
+def overview_tap(event):
+    """Show the channel and time bin of the tapped heatmap cell"""
+    sf = app_data["app_vars"]["sf"]
+    cell = app_data["overview"]["activity"].cell(round(event.y), event.x * sf)
+    if cell is None:
+        return
+    position = "{ch}:{start}-{end}".format(
+        ch=round(event.y), start=math.floor(cell[0] / sf), end=math.ceil(cell[1] / sf)
+    )
+    if app_data["wdg_dict"]["position"].value == position:
+        # Unchanged, so parse_position is not called, just show it again
+        update()
+    else:
+        app_data["wdg_dict"]["position"].value = position
+
+
+def release_files(*files):
+    """Give open h5py files back to the shared handle pool, skipping None"""
+    for f in files:
+        handle_pool.release(f)
 
 
 def read_bmf(run_id):
-    run_id = run_id + ".bmf"
+    """Index the mappings for a run on the load thread"""
+    run_async("bmf", partial(load_bmf, run_id), apply_bmf)
+
+
+def load_bmf(run_id):
+    bmf_file = run_id + ".bmf"
     try:
-        app_data["bmf"] = pd.read_csv(Path(Path(cfg_dr["map"]) / run_id), sep="\t")
-        # filter mappings to just this run
-        app_data["bmf"] = app_data["bmf"][
-            app_data["bmf"]["run_id"] == app_data["app_vars"]["Run ID"]
-        ]
+        # index mappings from just this run by channel
+        return read_bmf_index(Path(Path(cfg_dr["map"]) / bmf_file), run_id)
     except FileNotFoundError:
         pass
     except Exception as e:
         print(e)
-    return
+    return None
 
 
-def open_bulkfile(path):
-    # !!! add in check to see if this is a ONT bulkfile
-    # Open bulkfile in read-only mode
-    open_file = h5py.File(path, "r")
-    # Get sample frequency, how many data points are collected each second
-    sf = int(
-        open_file["UniqueGlobalKey"]["context_tags"]
-        .attrs["sample_frequency"]
-        .decode("utf8")
-    )
-    attributes = OrderedDict(
-        [
-            (
-                "tracking_id",
-                [
-                    ("Experiment", "sample_id"),
-                    ("Flowcell ID", "flow_cell_id"),
-                    ("MinKNOW version", "version"),
-                    ("Protocols version", "protocols_version"),
-                    ("MinION ID", "device_id"),
-                    ("Hostname", "hostname"),
-                    ("Run ID", "run_id"),
-                    ("ASIC ID", "asic_id"),
-                    ("Experiment start", "exp_start_time"),
-                ],
-            ),
-            (
-                "context_tags",
-                [
-                    ("Sequencing kit", "sequencing_kit"),
-                    ("Flowcell type", "flowcell_type"),
-                ],
-            ),
-        ]
-    )
+def apply_bmf(bmf):
+    app_data["bmf"] = bmf
+    if bmf is not None and not app_data["INIT"]:
+        toggle_button(None)
 
-    for k, v in attributes.items():
+
+def open_sidecar_for(bulk_path, path):
+    """Open the sidecar of bulk_path for the handle pool, see open_sidecar"""
+    return open_sidecar(bulk_path)
+
+
+def file_attributes(entry):
+    """Return {label: value} of the BULKFILE_ATTRIBUTES of a catalogue entry, 'N/A' if missing"""
+    values = {}
+    for k, v in BULKFILE_ATTRIBUTES.items():
         for attribute in v:
             try:
-                app_data["app_vars"][attribute[0]] = (
-                    open_file["UniqueGlobalKey"][k].attrs[attribute[1]].decode("utf8")
-                )
+                values[attribute[0]] = entry["attributes"][k][attribute[1]]
                 if attribute[1] == "exp_start_time":
-                    app_data["app_vars"][attribute[0]] = parser.parse(
-                        app_data["app_vars"][attribute[0]]
-                    ).strftime("%d-%b-%Y %H:%M:%S")
+                    values[attribute[0]] = parser.parse(values[attribute[0]]).strftime(
+                        "%d-%b-%Y %H:%M:%S"
+                    )
             except KeyError:
-                app_data["app_vars"][attribute[0]] = "N/A"
-    return open_file, sf, attributes
+                values[attribute[0]] = "N/A"
+    return values
+
+
+def apply_read_index(read_index):
+    """Store the ReadIndex built for parse_position and parse the position again"""
+    app_data["read_index"] = read_index
+    position = app_data["wdg_dict"]["position"]
+    parse_position("value", position.value, position.value)
 
 
-# noinspection PyUnboundLocalVariable
 def parse_position(attr, old, new):
-    if re.match(r"^(\@[a-f0-9\-]{36})([a-z0-9=\s]{1,})ch=[0-9]{1,4}", new):
-        # https://regex101.com/r/9VvgNM/4
-        # Match UUID / read_id as fastq str
-        #   ^(\@[a-f0-9\-]{36})
-        # Match lowercase a-z, 0-9, '=' and whitespace
-        #   ([a-z0-9=\s]{1,})
-        # Match 'ch=' and up to 4 numbers
-        #   ch=[0-9]{1,4}
-        # if new[0] == "@":
+    read_match = re.match(r"^@?([a-f0-9\-]{36})(\s|\Z)", new)
+    if read_match:
+        # Match a read id, either alone or at the start of a complete FASTQ header
+        #   ^@?([a-f0-9\-]{36})
+        # followed by whitespace or the end of the input
+        #   (\s|\Z)
         input_error(app_data["wdg_dict"]["position"], "remove")
-        fq = new[1:]
-        fq_list = fq.split(" ")
-        # split out read_id and channel
-        for k, item in enumerate(fq_list):
-            if k == 0:
-                read_id = item
-            if item.split("=")[0] == "ch":
-                channel_num = item.split("=")[1]
-                channel_str = "Channel_{num}".format(num=channel_num)
-        # Get ch_str, start, end
-        # If read_id and ch not set...
-        # noinspection PyUnboundLocalVariable
-        if read_id and channel_str:
-            int_data_path = app_data["bulkfile"]["IntermediateData"][channel_str][
-                "Reads"
-            ]
-            int_data_labels = {
-                "read_id": int_data_path["read_id"],
-                "read_start": int_data_path["read_start"],
-            }
-            df = pd.DataFrame(data=int_data_labels)
-            df.read_start = df.read_start / app_data["app_vars"]["sf"]
-            df.read_id = df.read_id.str.decode("utf8")
-            df = df.where(df.read_id == read_id)
-            df = df.dropna()
-            if len(df) > 2:
-                start_time = math.floor(df.iloc[0, :].read_start)
-                end_time = math.ceil(df.iloc[-1, :].read_start)
-            else:
-                input_error(app_data["wdg_dict"]["position"], "add")
-                return
-        else:
+        if app_data["read_index"] is None:
+            # Build the index on the load thread, then parse the position again
+            run_async(
+                "read_index",
+                partial(load_read_index, app_data["bulkfile"], app_data["sidecar"]),
+                apply_read_index,
+            )
+            return
+        coords = app_data["read_index"].lookup(read_match.group(1))
+        if coords is None:
             input_error(app_data["wdg_dict"]["position"], "add")
             return
+        channel_num, start_index, end_index = coords
+        start_time = math.floor(start_index / app_data["app_vars"]["sf"])
+        end_time = max(
+            math.ceil(end_index / app_data["app_vars"]["sf"]), start_time + 1
+        )
+        # Setting the position as coordinates parses it again and updates the plot
         app_data["wdg_dict"]["position"].value = "{ch}:{start}-{end}".format(
             ch=channel_num, start=start_time, end=end_time
         )
+        return
+    elif re.match(r"^([0-9,\-]+:[0-9]{1,9}-[0-9]{1,9})\Z", new) and re.match(
+        r"^[0-9]{1,4}[,\-]", new
+    ):
+        # A list or range of channels, e.g. 100-116,200:300-360
+        channels_spec, times = new.rsplit(":", 1)
+        start_time, end_time = (int(t) for t in times.split("-"))
+        try:
+            channels = parse_channels(channels_spec)
+        except ValueError:
+            input_error(app_data["wdg_dict"]["position"], "add")
+            return
+        if end_time - start_time <= 0 or len(channels) > int(cfg_st["max_channels"]):
+            input_error(app_data["wdg_dict"]["position"], "add")
+            return
+        input_error(app_data["wdg_dict"]["position"], "remove")
+        end_time = min(end_time, int(app_data["app_vars"]["len_ds"]))
+        app_data["app_vars"]["channels"] = channels
+        app_data["app_vars"]["channels_spec"] = channels_spec
+        app_data["app_vars"]["channel_num"] = channels[0]
+        app_data["app_vars"]["channel_str"] = "Channel_{num}".format(num=channels[0])
+        app_data["app_vars"]["start_time"] = start_time
+        app_data["app_vars"]["end_time"] = end_time
+        app_data["wdg_dict"]["position"].value = "{chs}:{start}-{end}".format(
+            chs=channels_spec, start=start_time, end=end_time
+        )
+        update()
+        return
     elif re.match(r"^([0-9]{1,4}:[0-9]{1,9}-[0-9]{1,9})\Z", new):
         # https://regex101.com/r/zkN1j2/2
         input_error(app_data["wdg_dict"]["position"], "remove")
@@ -410,6 +672,8 @@ def parse_position(attr, old, new):
 
     if int(end_time) > app_data["app_vars"]["len_ds"]:
         end_time = app_data["app_vars"]["len_ds"]
+    app_data["app_vars"].pop("channels", None)
+    app_data["app_vars"].pop("channels_spec", None)
     app_data["app_vars"]["channel_str"] = channel_str
     app_data["app_vars"]["channel_num"] = int(channel_num)
     app_data["app_vars"]["start_time"] = int(start_time)
@@ -424,61 +688,358 @@ def parse_position(attr, old, new):
     update()
 
 
-def update_data(bulkfile, app_vars):
+def load_signal(bulkfile, sidecar, channel_str, sf, start, end, level):
+    """Return samples [start, end) of a channel clipped to the cut-offs
+
+    Level 0 reads every sample, higher levels read the min/max envelope with
+    bins of 2**level samples, see bulkvis.pyramid.read_window. Safe to call
+    from the read-ahead threads.
+    Returns
+    -------
+    tuple
+        (x start, x step, y) with the x of the first point and the spacing of
+        the points in seconds
+    """
+    first, step, y_data = read_window(
+        bulkfile,
+        channel_str,
+        start,
+        end,
+        level,
+        cut_offs(),
+        sidecar=sidecar,
+        cache=signal_cache,
+    )
+    return first / sf, step / sf, y_data
+
+
+def cut_offs():
+    """Return the (lower, upper) limits of the plotted signal"""
+    return int(cfg_po["lower_cut_off"]), int(cfg_po["upper_cut_off"])
+
+
+def signal_request(app_vars, start_time, end_time, n_pixels=None):
+    """Return the (start, end, level) of the signal load_data reads for a window"""
+    start_squiggle = math.floor(start_time * app_vars["sf"])
+    end_squiggle = math.floor(end_time * app_vars["sf"])
+    n_samples = end_squiggle - start_squiggle
+    margin = window_margin(n_samples)
+    level = choose_level(n_samples, n_pixels) if n_pixels else 0
+    return start_squiggle - margin, end_squiggle + margin, level
+
+
+def prefetch_windows(app_vars):
+    """Load the windows navigation is likely to show next in the background
+
+    These are the windows of the same duration either side of the current one
+    and, after a jump, the next and previous events of the same classification.
+    Navigation turns smoothing on, so windows are requested at the plot width.
+    """
+    duration = app_vars["duration"]
+    starts = [app_vars["start_time"] - duration, app_vars["end_time"]]
+    code = app_vars.get("jump_code")
+    if code is not None:
+        annotations = app_data["annotations"]
+        starts.append(annotations.next_event(code, app_vars["start_time"] + 1))
+        starts.append(annotations.previous_event(code, app_vars["start_time"]))
+    n_pixels = int(app_data["wdg_dict"]["po_width"].value)
+    for start in starts:
+        if start is None:
+            continue
+        start = int(math.floor(start))
+        if start < 0 or start + duration > app_vars["len_ds"]:
+            continue
+        request = signal_request(app_vars, start, start + duration, n_pixels)
+        read_ahead.prefetch(
+            (app_data["file_src"], app_vars["channel_str"]) + request,
+            load_signal,
+            app_data["bulkfile"],
+            app_data["sidecar"],
+            app_vars["channel_str"],
+            app_vars["sf"],
+            *request,
+        )
+
+
+def load_data(bulkfile, sidecar, file_src, app_vars, n_pixels=None, annotations=None):
+    """Load the signal window, and the annotations if not given, for a position
+
+    Runs on the load thread, so app_vars is a copy and nothing shared is
+    modified, see apply_data. If n_pixels is set the signal is loaded as a
+    min/max envelope with roughly one bin per pixel, otherwise every sample in
+    the window is loaded.
+    """
+    start, end, level = signal_request(
+        app_vars, app_vars["start_time"], app_vars["end_time"], n_pixels
+    )
+    signal = read_ahead.get((file_src, app_vars["channel_str"], start, end, level))
+    if signal is None:
+        signal = load_signal(
+            bulkfile,
+            sidecar,
+            app_vars["channel_str"],
+            app_vars["sf"],
+            start,
+            end,
+            level,
+        )
+    # get annotations, indexed once per channel
+    if annotations is None:
+        annotations = load_channel_annotations(
+            bulkfile, app_vars["channel_str"], app_vars["sf"], sidecar
+        )
+    # y limits of the window from the sidecar's signal statistics, if indexed
+    limits = None
+    if sidecar is not None:
+        limits = window_limits(
+            sidecar,
+            app_vars["channel_str"],
+            math.floor(app_vars["start_time"] * app_vars["sf"]),
+            math.floor(app_vars["end_time"] * app_vars["sf"]),
+            cut_offs(),
+        )
+    return {
+        "signal": signal,
+        "limits": limits,
+        "level": level,
+        "len_ds": signal_length(bulkfile, app_vars["channel_str"]) / app_vars["sf"],
+        "annotations": annotations,
+    }
+
+
+def request_data(n_pixels=None):
+    """Load the current position on the load thread, then draw it with apply_data"""
+    app_vars = app_data["app_vars"]
+    run_async(
+        "data",
+        partial(
+            load_data,
+            app_data["bulkfile"],
+            app_data["sidecar"],
+            app_data["file_src"],
+            dict(app_vars),
+            n_pixels,
+            app_data["annotation_index"].get(app_vars["channel_str"]),
+        ),
+        apply_data,
+    )
+
+
+def apply_data(data):
+    """Store the data returned by load_data and draw it"""
+    app_vars = app_data["app_vars"]
     app_vars["duration"] = app_vars["end_time"] - app_vars["start_time"]
     # get times and squiggles
     app_vars["start_squiggle"] = math.floor(app_vars["start_time"] * app_vars["sf"])
     app_vars["end_squiggle"] = math.floor(app_vars["end_time"] * app_vars["sf"])
-    # get data in numpy arrays
-    step = 1 / app_vars["sf"]
-    app_data["x_data"] = np.arange(app_vars["start_time"], app_vars["end_time"], step)
-    app_data["y_data"] = bulkfile["Raw"][app_vars["channel_str"]]["Signal"][()]
-    app_vars["len_ds"] = len(app_data["y_data"]) / app_vars["sf"]
-    app_data["y_data"] = app_data["y_data"][
-        app_vars["start_squiggle"] : app_vars["end_squiggle"]
+    app_vars["len_ds"] = data["len_ds"]
+    app_vars["level"] = data["level"]
+    app_vars["y_limits"] = data["limits"]
+    app_data["signal"] = data["signal"]
+    LOGGER.info(f"Signal cache: {signal_cache}")
+    LOGGER.info(f"Read-ahead: {read_ahead}")
+    app_data["annotation_index"][app_vars["channel_str"]] = data["annotations"]
+    app_data["annotations"] = data["annotations"]
+    app_data["label_dt"] = OrderedDict(app_data["annotations"].labels)
+
+    if app_data["INIT"]:
+        init_view()
+    layout.children[1] = app_data["plot"]["root"]
+    app_data["wdg_dict"]["duration"].text = "Duration: {d} seconds".format(
+        d=app_vars["duration"]
+    )
+    update_figure(app_data["signal"], app_data["wdg_dict"], app_vars)
+    prefetch_windows(app_vars)
+
+
+def init_view():
+    """Build the widgets and figure for the file once its first position is loaded"""
+    build_widgets()
+    layout.children[0] = column(
+        list(app_data["wdg_dict"].values()), width=int(cfg_po["wdg_width"])
+    )
+    create_figure(app_data["wdg_dict"])
+    app_data["INIT"] = False
+
+
+def request_stack(n_pixels):
+    """Load the current window of every channel in the stack, then draw them"""
+    app_vars = app_data["app_vars"]
+    run_async(
+        "data",
+        partial(
+            load_stack,
+            app_data["file_src"],
+            app_data["bulkfile"],
+            app_data["sidecar"],
+            dict(app_vars),
+            n_pixels,
+            app_data["annotation_index"].get(app_vars["channel_str"]),
+        ),
+        apply_stack,
+    )
+
+
+def load_stack(file_src, bulkfile, sidecar, app_vars, n_pixels, annotations=None):
+    """Read the window of each channel in app_vars['channels'] in the stack workers
+
+    Runs on the load thread, the annotations of the first channel are loaded
+    if not given, see load_data.
+    """
+    sf = app_vars["sf"]
+    windows = stack_reader.read(
+        file_src,
+        app_vars["channels"],
+        math.floor(app_vars["start_time"] * sf),
+        math.floor(app_vars["end_time"] * sf),
+        n_pixels,
+        cut_offs(),
+    )
+    if annotations is None:
+        annotations = load_channel_annotations(
+            bulkfile, app_vars["channel_str"], sf, sidecar
+        )
+    return {"windows": windows, "annotations": annotations}
+
+
+def apply_stack(data):
+    """Draw the windows returned by load_stack as linked, stacked plots"""
+    app_vars = app_data["app_vars"]
+    app_vars["duration"] = app_vars["end_time"] - app_vars["start_time"]
+    app_data["annotation_index"][app_vars["channel_str"]] = data["annotations"]
+    app_data["annotations"] = data["annotations"]
+    app_data["label_dt"] = OrderedDict(app_data["annotations"].labels)
+    if app_data["INIT"]:
+        init_view()
+    app_data["wdg_dict"]["duration"].text = "Duration: {d} seconds".format(
+        d=app_vars["duration"]
+    )
+    channels = [
+        (ch, window)
+        for ch, window in zip(app_vars["channels"], data["windows"])
+        if window is not None
     ]
-    # get annotations
-    path = bulkfile["IntermediateData"][app_vars["channel_str"]]["Reads"]
-    fields = ["read_id", "read_start", "modal_classification"]
-    app_data["label_df"], app_data["label_dt"] = get_annotations(
-        path, fields, "modal_classification"
-    )
-    app_data["label_df"] = app_data["label_df"].drop_duplicates(
-        subset=["read_id", "modal_classification"], keep="first"
-    )
-    app_data["label_df"].read_start = app_data["label_df"].read_start / app_vars["sf"]
-    app_data["label_df"].read_id = app_data["label_df"].read_id.str.decode("utf8")
-
-    path = bulkfile["StateData"][app_vars["channel_str"]]["States"]
-    fields = ["acquisition_raw_index", "summary_state"]
-    state_label_df, state_label_dtypes = get_annotations(path, fields, "summary_state")
-    state_label_df.acquisition_raw_index = (
-        state_label_df.acquisition_raw_index / app_vars["sf"]
-    )
-    state_label_df = state_label_df.rename(
-        columns={
-            "acquisition_raw_index": "read_start",
-            "summary_state": "modal_classification",
-        }
+    stack = app_data.get("stack")
+    if stack is None or stack["channels"] != [ch for ch, _ in channels]:
+        stack = app_data["stack"] = create_stack([ch for ch, _ in channels])
+    x_range = stack["x_range"]
+    x_range.update(
+        start=app_vars["start_time"],
+        end=app_vars["end_time"],
+        reset_start=app_vars["start_time"],
+        reset_end=app_vars["end_time"],
     )
-    app_data["label_df"] = app_data["label_df"].append(
-        state_label_df, ignore_index=True
+    for (ch, (first, step, y_data)), panel in zip(channels, stack["panels"]):
+        panel["signal_x"].args = dict(
+            start=first / app_vars["sf"], step=step / app_vars["sf"]
+        )
+        panel["source"].data = {"y": y_data}
+        limits = signal_limits(y_data)
+        if limits is not None:
+            y_min, y_max = float(limits[0]), float(limits[1])
+            pad = max((y_max - y_min) * 0.05, 1)
+            panel["figure"].y_range.update(start=y_min - pad, end=y_max + pad)
+    layout.children[1] = stack["root"]
+
+
+def create_stack(channels):
+    """Build one small figure per channel, sharing an x range, see apply_stack"""
+    wdg = app_data["wdg_dict"]
+    x_range = Range1d(0, 1)
+    height = max(
+        int(wdg["po_height"].value) // max(len(channels), 1),
+        int(cfg_st["min_height"]),
     )
-    app_data["label_df"].sort_values(by="read_start", ascending=True, inplace=True)
-    app_data["label_dt"].update(state_label_dtypes)
+    panels = []
+    for i, channel in enumerate(channels):
+        p = figure(
+            plot_height=height,
+            plot_width=int(wdg["po_width"].value),
+            toolbar_location="right" if i == 0 else None,
+            tools=["xbox_zoom", "xpan", "reset", "save"],
+            active_drag="xbox_zoom",
+            x_range=x_range,
+            y_range=Range1d(0, 1),
+            min_border_top=2,
+            min_border_bottom=2,
+        )
+        p.output_backend = app_data["plot"]["figure"].output_backend
+        p.toolbar.logo = None
+        p.yaxis.axis_label = "Ch {ch}".format(ch=channel)
+        p.yaxis.major_label_orientation = "horizontal"
+        p.xaxis.visible = i == len(channels) - 1
+        source = ColumnDataSource(data=dict(y=np.empty(0, dtype=np.int16)))
+        signal_x, signal_y = signal_transforms()
+        p.line(
+            source=source,
+            x=transform("y", signal_x),
+            y=transform("y", signal_y),
+            line_width=1,
+        )
+        panels.append({"figure": p, "source": source, "signal_x": signal_x})
+    if panels:
+        panels[-1]["figure"].xaxis.axis_label = "Time (seconds)"
+        panels[-1]["figure"].xaxis.major_label_orientation = math.radians(45)
+    return {
+        "channels": list(channels),
+        "x_range": x_range,
+        "panels": panels,
+        "root": column([panel["figure"] for panel in panels], css_classes=["plot_div"]),
+    }
+
+
+def run_async(name, work, apply, discard=None):
+    """Run work() on the load thread, then apply(result) on the next document tick
+
+    A request replaces any pending request with the same name: one superseded
+    before it starts is skipped and a superseded result is dropped, so a burst
+    of edits leads to a single load of the latest. A dropped result is passed
+    to discard, if given, to release what work acquired. The plot is marked as
+    loading while any request is pending.
+    """
+    token = object()
+    pending_requests[name] = token
+    show_loading()
+
+    def task():
+        if pending_requests.get(name) is not token:
+            return None
+        return work()
+
+    def done(future):
+        doc.add_next_tick_callback(
+            partial(finish_async, name, token, apply, future, discard)
+        )
+
+    load_executor.submit(task).add_done_callback(done)
+
+
+def finish_async(name, token, apply, future, discard=None):
+    """Apply the result of a request made by run_async, if it is still the latest"""
+    if pending_requests.get(name) is not token:
+        if discard is not None and future.exception() is None:
+            discard(future.result())
+        return
+    del pending_requests[name]
+    show_loading()
+    try:
+        result = future.result()
+    except Exception as e:
+        LOGGER.exception(f"Loading {name} failed")
+        if "duration" in app_data["wdg_dict"]:
+            app_data["wdg_dict"]["duration"].text += "\nError: {e}".format(e=e)
+        return
+    apply(result)
 
 
-def get_annotations(path, fields, enum_field):
-    data_labels = {}
-    for field in fields:
-        data_labels[field] = path[field]
-    data_dtypes = {}
-    if h5py.check_dtype(enum=path.dtype[enum_field]):
-        dataset_dtype = h5py.check_dtype(enum=path.dtype[enum_field])
-        # data_dtype may lose some dataset dtypes there are duplicates of 'v'
-        data_dtypes = {v: k for k, v in dataset_dtype.items()}
-    labels_df = pd.DataFrame(data=data_labels)
-    return labels_df, data_dtypes
+def show_loading():
+    """Mark the plot as loading while any request is pending"""
+    plot_div = layout.children[1]
+    loading = bool(pending_requests)
+    if loading and "plot-loading" not in plot_div.css_classes:
+        plot_div.css_classes.append("plot-loading")
+    elif not loading and "plot-loading" in plot_div.css_classes:
+        plot_div.css_classes.remove("plot-loading")
 
 
 def build_widgets():
@@ -525,6 +1086,7 @@ def build_widgets():
     wdg["jump_prev"] = Dropdown(
         label="Jump to previous", button_type="primary", menu=jump_list
     )
+    wdg["show_overview"] = Button(label="Flowcell overview", button_type="primary")
 
     wdg["export_label"] = Div(
         text="Export data:", css_classes=["export-dropdown", "help-text"]
@@ -625,12 +1187,21 @@ def build_widgets():
         css_classes=["toggle_button_g_r", "adjust-drop"],
         active=True,
     )
+    wdg["toggle_live"] = Toggle(
+        label="Live tail",
+        button_type="danger",
+        css_classes=["toggle_button_g_r", "adjust-drop"],
+        active=False,
+    )
 
     wdg["label_filter"].on_change("active", update_checkboxes)
     wdg["filter_toggle_group"].on_change("active", update_toggle)
     wdg["jump_next"].on_click(next_update)
     wdg["jump_prev"].on_click(prev_update)
     wdg["save_read_file"].on_click(export_data)
+    wdg["show_overview"].on_click(show_overview)
+    wdg["toggle_smoothing"].on_click(update_smoothing)
+    wdg["toggle_live"].on_click(toggle_live)
 
     for name in toggle_inputs:
         wdg[name].on_click(toggle_button)
@@ -639,83 +1210,64 @@ def build_widgets():
     return wdg
 
 
-def create_figure(x_data, y_data, wdg, app_vars):
-    def vline(x_coords, y_upper, y_lower):
-        # Return a dataset that can plot vertical lines
-        x_values = np.vstack((x_coords, x_coords)).T
-        y_upper_list = np.full((1, len(x_values)), y_upper)
-        y_lower_list = np.full((1, len(x_values)), y_lower)
-        y_values = np.vstack((y_lower_list, y_upper_list)).T
-        return x_values.tolist(), y_values.tolist()
-
-    def hlines(y_coords, x_lower, x_upper):
-        """
-
-        Parameters
-        ----------
-        y_coords: (int, float) height to plot lines at
-        x_lower: (int, float) lower x coord
-        x_upper: (int, float) upper x coord
-
-        Returns
-        -------
+def signal_transforms():
+    """Return the transforms drawing a signal data source holding only y
 
-        """
-        x_values = np.vstack((x_lower, x_upper)).T
-        y_values_list = np.full((1, len(x_values)), y_coords)
-        y_values = np.vstack((y_values_list, y_values_list)).T
-        return x_values.tolist(), y_values.tolist()
-
-    if wdg["toggle_smoothing"].active:
-        w_range = app_vars["duration"]
-        divisor = math.e ** 2.5
-        thin_factor = math.ceil(w_range / divisor)
-    else:
-        thin_factor = 1
-    if thin_factor == 0:
-        thin_factor = 1
-
-    greater_delete_index = np.argwhere(y_data > int(cfg_po["upper_cut_off"]))
-    x_data = np.delete(x_data, greater_delete_index)
-    y_data = np.delete(y_data, greater_delete_index)
+    x is rebuilt in the browser from the start and step of the (evenly spaced)
+    signal, set as args of the first transform, and gaps are restored from
+    SIGNAL_GAP by the second.
+    """
+    signal_x = CustomJSTransform(
+        args=dict(start=0, step=1),
+        v_func="""
+            const x = new Float64Array(xs.length)
+            for (let i = 0; i < xs.length; i++) x[i] = start + i * step
+            return x
+        """,
+    )
+    signal_y = CustomJSTransform(
+        args=dict(gap=SIGNAL_GAP),
+        v_func="""
+            const y = new Float32Array(xs.length)
+            for (let i = 0; i < xs.length; i++) y[i] = xs[i] === gap ? NaN : xs[i]
+            return y
+        """,
+    )
+    return signal_x, signal_y
 
-    lesser_delete_index = np.argwhere(y_data < int(cfg_po["lower_cut_off"]))
-    x_data = np.delete(x_data, lesser_delete_index)
-    y_data = np.delete(y_data, lesser_delete_index)
 
-    x_data = x_data[::thin_factor]
-    y_data = y_data[::thin_factor]
+def create_figure(wdg):
+    """Build the squiggle figure and its (empty) data sources, once per bulk file
 
-    data = {
-        "x": x_data,
-        "y": y_data,
+    The figure is updated in place by update_figure, so only changed data is
+    sent to the browser when the position, toggles or filters change.
+    """
+    sources = {
+        "signal": ColumnDataSource(data=dict(y=np.empty(0, dtype=np.int16))),
+        "annotation_lines": ColumnDataSource(data=dict(xs=[], ys=[])),
+        "annotation_labels": ColumnDataSource(data=dict(x=[], y=[], t=[])),
+        "mapping_labels": ColumnDataSource(
+            data=dict(start_time=[], height=[], label=[], offset=[])
+        ),
+        "mapping_fwd": ColumnDataSource(data=dict(xs=[], ys=[])),
+        "mapping_rev": ColumnDataSource(data=dict(xs=[], ys=[])),
     }
 
-    source = ColumnDataSource(data=data)
-
     p = figure(
         plot_height=int(wdg["po_height"].value),
         plot_width=int(wdg["po_width"].value),
         toolbar_location="right",
         tools=["xbox_zoom", "xpan", "undo", "reset", "save"],
         active_drag="xbox_zoom",
+        x_range=Range1d(0, 1),
+        y_range=Range1d(0, 1),
     )
     if cfg_po["output_backend"] not in output_backend:
         p.output_backend = "canvas"
     else:
         p.output_backend = cfg_po["output_backend"]
-    # Add step/% points plotted: Step: {sp} ({pt:.3f}) -> sp=thin_factor, pt=1/thin_factor
-    p.add_layout(
-        Title(
-            text="Channel: {ch} Start: {st} End: {ed} Sample rate: {sf}".format(
-                ch=app_vars["channel_num"],
-                st=app_vars["start_time"],
-                ed=app_vars["end_time"],
-                sf=app_vars["sf"],
-            )
-        ),
-        "above",
-    )
+    position_title = Title(text="")
+    p.add_layout(position_title, "above")
     p.add_layout(
         Title(
             text="bulk FAST5 file: {s}".format(
@@ -729,195 +1281,362 @@ def create_figure(x_data, y_data, wdg, app_vars):
     p.yaxis.axis_label = "Raw signal"
     p.yaxis.major_label_orientation = "horizontal"
     p.xaxis.axis_label = "Time (seconds)"
-    p.line(source=source, x="x", y="y", line_width=1)
+    signal_x, signal_y = signal_transforms()
+    p.line(
+        source=sources["signal"],
+        x=transform("y", signal_x),
+        y=transform("y", signal_y),
+        line_width=1,
+    )
     p.xaxis.major_label_orientation = math.radians(45)
-    p.x_range.range_padding = 0.01
 
-    # set padding manually
-    y_min = np.amin(data["y"])
-    y_max = np.amax(data["y"])
-    pad = (y_max - y_min) * 0.1 / 2
-    p.y_range = Range1d(y_min - pad, y_max + pad)
-    try:
-        app_data["bmf"]
-    except NameError:
-        bmf_set = False
-    except KeyError:
-        bmf_set = False
+    # Mappings: labels, then forward (blue) and reverse (red) lines
+    mapping_labels = LabelSet(
+        x="start_time",
+        y="height",
+        text="label",
+        level="glyph",
+        x_offset=5,
+        y_offset="offset",
+        source=sources["mapping_labels"],
+        render_mode="canvas",
+    )
+    p.add_layout(mapping_labels)
+    mapping_renderers = [
+        mapping_labels,
+        p.multi_line(
+            source=sources["mapping_fwd"],
+            xs="xs",
+            ys="ys",
+            line_dash="solid",
+            color="blue",
+            line_width=1,
+        ),
+        p.multi_line(
+            source=sources["mapping_rev"],
+            xs="xs",
+            ys="ys",
+            line_dash="solid",
+            color="red",
+            line_width=1,
+        ),
+    ]
+
+    # Annotations: vertical lines at each event with a rotated label
+    annotation_labels = LabelSet(
+        x="x",
+        y="y",
+        text="t",
+        level="glyph",
+        x_offset=0,
+        y_offset=0,
+        source=sources["annotation_labels"],
+        render_mode="canvas",
+        angle=-270,
+        angle_units="deg",
+    )
+    p.add_layout(annotation_labels)
+    annotation_renderers = [
+        annotation_labels,
+        p.multi_line(
+            source=sources["annotation_lines"],
+            xs="xs",
+            ys="ys",
+            line_dash="dashed",
+            color="green",
+            line_width=1,
+        ),
+    ]
+
+    app_data["plot"] = {
+        "figure": p,
+        "sources": sources,
+        "signal_x": signal_x,
+        "position_title": position_title,
+        "mapping_renderers": mapping_renderers,
+        "annotation_renderers": annotation_renderers,
+        "view": None,  # (start, end) of the last window drawn by update_figure
+        "zoom": None,  # pending re-resolution callback
+        "zoomed": False,  # True if the signal shown is not the window's
+    }
+    p.x_range.on_change("start", update_range)
+    p.x_range.on_change("end", update_range)
+    app_data["plot"]["root"] = column(p, css_classes=["plot_div"])
+    return app_data["plot"]["root"]
+
+
+def update_range(attr, old, new):
+    """Debounce x_range changes from zooming and panning, then re-resolve the signal"""
+    plot = app_data["plot"]
+    if plot["zoom"] is not None:
+        try:
+            doc.remove_timeout_callback(plot["zoom"])
+        except ValueError:
+            pass
+    plot["zoom"] = doc.add_timeout_callback(
+        resolve_range, int(cfg_po["zoom_delay_ms"])
+    )
+
+
+def resolve_range():
+    """Load the visible x range at the finest resolution that fits zoom_points
+
+    Returning to the window drawn by update_figure restores its data, any other
+    range is read from the bulk file (or sidecar) with at most zoom_points points.
+    """
+    plot = app_data["plot"]
+    plot["zoom"] = None
+    x_range = plot["figure"].x_range
+    start, end = x_range.start, x_range.end
+    if start is None or end is None or plot["view"] is None:
+        return
+    app_vars = app_data["app_vars"]
+    if (start, end) == plot["view"]:
+        if plot["zoomed"]:
+            plot["zoomed"] = False
+            show_signal(app_data["signal"])
+            update_events(
+                app_data["wdg_dict"],
+                app_vars,
+                app_vars["start_time"],
+                app_vars["end_time"],
+            )
+        return
+    sf = app_vars["sf"]
+    n_total = signal_length(app_data["bulkfile"], app_vars["channel_str"])
+    start_squiggle = min(max(math.floor(start * sf), 0), n_total)
+    end_squiggle = min(max(math.ceil(end * sf), 0), n_total)
+    level = budget_level(end_squiggle - start_squiggle, int(cfg_po["zoom_points"]))
+    run_async(
+        "zoom",
+        partial(
+            load_signal,
+            app_data["bulkfile"],
+            app_data["sidecar"],
+            app_vars["channel_str"],
+            sf,
+            start_squiggle,
+            end_squiggle,
+            level,
+        ),
+        partial(apply_range, plot["view"], (start, end), level),
+    )
+
+
+def apply_range(view, visible, level, signal):
+    """Draw a re-resolved range, unless the window has changed since it was requested
+
+    The annotations and mappings are binned again for the visible range.
+    """
+    plot = app_data.get("plot")
+    if plot is None or plot["view"] != view:
+        return
+    plot["zoomed"] = True
+    show_signal(signal)
+    update_events(app_data["wdg_dict"], app_data["app_vars"], *visible)
+    LOGGER.info(f"Re-resolved the visible range at level {level}, {len(signal[2])} points")
+
+
+def show_signal(signal):
+    """Send a signal returned by load_signal to the plot
+
+    Only y is sent, int16 with SIGNAL_GAP gaps or float32 with NaN gaps, x is
+    rebuilt in the browser from its start and step, see create_figure.
+    """
+    plot = app_data["plot"]
+    start, step, y_data = signal
+    # Update the transform first, both changes are drawn together
+    plot["signal_x"].args = dict(start=start, step=step)
+    plot["sources"]["signal"].data = {"y": y_data}
+
+
+def update_figure(signal, wdg, app_vars):
+    """Patch the figure built by create_figure with the current data and widget state"""
+    plot = app_data["plot"]
+    p = plot["figure"]
+
+    show_signal(signal)
+    x_start, x_step, y_data = signal
+
+    p.plot_height = int(wdg["po_height"].value)
+    p.plot_width = int(wdg["po_width"].value)
+    plot["position_title"].text = (
+        "Channel: {ch} Start: {st} End: {ed} Sample rate: {sf}".format(
+            ch=app_vars["channel_num"],
+            st=app_vars["start_time"],
+            ed=app_vars["end_time"],
+            sf=app_vars["sf"],
+        )
+    )
+    # The signal margin fills the padding either side of the window
+    if len(y_data):
+        x_end = x_start + x_step * (len(y_data) - 1)
+    else:
+        x_start, x_end = app_vars["start_time"], app_vars["end_time"]
+    # Remember the window so that re-resolution ignores this range change
+    plot["view"] = (x_start, x_end)
+    plot["zoomed"] = False
+    p.x_range.update(start=x_start, end=x_end, reset_start=x_start, reset_end=x_end)
+
+    # set padding manually, from the signal statistics when the file is indexed
+    limits = app_vars.get("y_limits")
+    if limits is None:
+        limits = signal_limits(y_data)
+    if wdg["toggle_y_axis"].active:
+        y_min, y_max = int(wdg["po_y_min"].value), int(wdg["po_y_max"].value)
+    elif limits is not None:
+        y_min, y_max = float(limits[0]), float(limits[1])
+        pad = (y_max - y_min) * 0.1 / 2
+        y_min, y_max = float(y_min - pad), float(y_max + pad)
     else:
-        bmf_set = True
-    if bmf_set and wdg["toggle_mappings"].active:
+        y_min, y_max = int(cfg_po["y_min"]), int(cfg_po["y_max"])
+    p.y_range.update(start=y_min, end=y_max, reset_start=y_min, reset_end=y_max)
+
+    update_events(wdg, app_vars, app_vars["start_time"], app_vars["end_time"])
+
+
+def update_events(wdg, app_vars, start, end):
+    """Draw the annotations and mappings between start and end, in seconds
+
+    Called with the window by update_figure and with the visible range after each
+    zoom or pan, so that labels binned for the window separate again when zoomed in.
+    """
+
+    def vline(x_coords, y_upper, y_lower):
+        # Return a dataset that can plot vertical lines
+        x_values = np.vstack((x_coords, x_coords)).T
+        y_upper_list = np.full((1, len(x_values)), y_upper)
+        y_lower_list = np.full((1, len(x_values)), y_lower)
+        y_values = np.vstack((y_lower_list, y_upper_list)).T
+        return x_values.tolist(), y_values.tolist()
+
+    def hlines(y_coords, x_lower, x_upper):
+        """
+
+        Parameters
+        ----------
+        y_coords: (int, float) height to plot lines at
+        x_lower: (int, float) lower x coord
+        x_upper: (int, float) upper x coord
+
+        Returns
+        -------
+
+        """
+        x_values = np.vstack((x_lower, x_upper)).T
+        y_values_list = np.full((1, len(x_values)), y_coords)
+        y_values = np.vstack((y_values_list, y_values_list)).T
+        return x_values.tolist(), y_values.tolist()
+
+    plot = app_data["plot"]
+    p = plot["figure"]
+    sources = plot["sources"]
+
+    # Beyond one label per label_px pixels, events are counted in bins of that width
+    n_labels = max(p.plot_width // int(cfg_po["label_px"]), 1)
+    bin_width = (end - start) / n_labels
+
+    bmf_set = app_data.get("bmf") is not None
+    show_mappings = bmf_set and wdg["toggle_mappings"].active
+    for renderer in plot["mapping_renderers"]:
+        renderer.visible = show_mappings
+    if show_mappings:
         LOGGER.info("Plotting mappings")
-        # set padding manually
-        # lower_pad = (y_max - y_min) * 0.1 / 2
-        # upper_pad = (y_max - y_min) / 2
-        # p.y_range = Range1d(y_min - lower_pad, y_max + upper_pad)
-        # set mapping track midpoints
-        # upper_mapping = upper_pad / 4 * 3 + y_max
-        # lower_mapping = upper_pad / 4 + y_max
         lower_mapping = int(wdg["label_height"].value) + 750
-        # Select only this channel
-        slim_bmf = app_data["bmf"][
-            app_data["bmf"]["channel"] == app_vars["channel_num"]
-        ]
-        # Select the current viewed range
-        slim_bmf = slim_bmf[
-            (
-                (slim_bmf["start_time"] > app_vars["start_time"])
-                & (slim_bmf["end_time"] < app_vars["end_time"])
+        # Select mappings on this channel that overlap the visible range
+        mappings = app_data["bmf"].channel(app_vars["channel_num"])
+        idx = mappings.overlapping(start, end)
+        slim_bmf = pd.DataFrame(
+            {
+                "start_time": np.maximum(mappings.start[idx], start),
+                "end_time": np.minimum(mappings.end[idx], end),
+                "strand": mappings.strand[idx],
+                "label": mappings.label[idx],
+                "height": lower_mapping,
+                "offset": 5 + mappings.lane[idx] * 15,
+            }
+        )
+        if len(slim_bmf) > n_labels:
+            # One line per strand spanning the mappings starting in each bin
+            slim_bmf["bin"] = np.clip(
+                (slim_bmf["start_time"] - start) // bin_width,
+                0,
+                n_labels - 1,
             )
-            | (
-                (slim_bmf["start_time"] < app_vars["start_time"])
-                & (slim_bmf["end_time"] < app_vars["end_time"])
-                & (slim_bmf["end_time"] > app_vars["start_time"])
+            grouped = slim_bmf.groupby(["bin", "strand"])
+            binned = grouped.agg(
+                start_time=("start_time", "min"),
+                end_time=("end_time", "max"),
+                count=("label", "size"),
+            ).reset_index()
+            binned["label"] = [
+                "{s} strand x{c:,d}".format(s=strand, c=count)
+                for strand, count in zip(binned["strand"], binned["count"])
+            ]
+            binned["height"] = lower_mapping
+            binned["offset"] = 5 + (binned["strand"] == "-") * 15
+            slim_bmf = binned
+        sources["mapping_labels"].data = {
+            k: slim_bmf[k].values for k in ["start_time", "height", "label", "offset"]
+        }
+        # Forward lines => blue, reverse lines => red
+        for strand, name in [("+", "mapping_fwd"), ("-", "mapping_rev")]:
+            strand_bmf = slim_bmf[slim_bmf["strand"] == strand]
+            v_x, v_y = vline(
+                np.concatenate(
+                    [strand_bmf["start_time"].values, strand_bmf["end_time"].values]
+                ),
+                lower_mapping + 20,
+                lower_mapping - 20,
             )
-            | (
-                (slim_bmf["start_time"] > app_vars["start_time"])
-                & (slim_bmf["end_time"] > app_vars["end_time"])
-                & (slim_bmf["start_time"] < app_vars["end_time"])
+            h_x, h_y = hlines(
+                lower_mapping, strand_bmf["start_time"], strand_bmf["end_time"]
             )
+            sources[name].data = {"xs": v_x + h_x, "ys": v_y + h_y}
+
+    show_annotations = wdg["toggle_annotations"].active
+    for renderer in plot["annotation_renderers"]:
+        renderer.visible = show_annotations
+    if show_annotations:
+        annotations = app_data["annotations"]
+        # Here labels are thinned out to the visible range
+        lo, hi = annotations.window(start, end)
+        # Remove unwanted annotations using the filter checkboxes
+        active_codes = [
+            code
+            for code, index in app_data["label_mp"].items()
+            if index in wdg["label_filter"].active
         ]
-        slim_bmf["start_time"] = slim_bmf["start_time"].where(
-            slim_bmf["start_time"] > app_vars["start_time"], app_vars["start_time"]
-        )
-        slim_bmf["end_time"] = slim_bmf["end_time"].where(
-            slim_bmf["end_time"] < app_vars["end_time"], app_vars["end_time"]
-        )
-
-        slim_bmf["height"] = lower_mapping
-        slim_bmf["offset"] = (
-            np.ones(len(slim_bmf)) * 5
-            + slim_bmf.groupby(["start_time", "end_time"]).cumcount() * 15
-        )
-        # Convert slim_bmf to ColDataSrc
-        mapping_source = ColumnDataSource(data=slim_bmf.to_dict(orient="list"))
-        # Add labels to LabelSet
-        mapping_labels = LabelSet(
-            x="start_time",
-            y="height",
-            text="label",
-            level="glyph",
-            x_offset=5,
-            y_offset="offset",
-            source=mapping_source,
-            render_mode="canvas",
-        )
-        p.add_layout(mapping_labels)
-        # Add some colour here
-        # Forward Vertical lines => blue
-        p_x, p_y = vline(
-            np.concatenate(
-                [
-                    slim_bmf["start_time"]
-                    .where(slim_bmf["strand"] == "+")
-                    .dropna()
-                    .values,
-                    slim_bmf["end_time"]
-                    .where(slim_bmf["strand"] == "+")
-                    .dropna()
-                    .values,
-                ]
-            ),
-            lower_mapping + 20,
-            lower_mapping - 20,
-        )
-        p.multi_line(p_x, p_y, line_dash="solid", color="blue", line_width=1)
-        # Reverse Vertical lines => red
-        p_x, p_y = vline(
-            np.concatenate(
-                [
-                    slim_bmf["start_time"]
-                    .where(slim_bmf["strand"] == "-")
-                    .dropna()
-                    .values,
-                    slim_bmf["end_time"]
-                    .where(slim_bmf["strand"] == "-")
-                    .dropna()
-                    .values,
-                ]
-            ),
-            lower_mapping + 20,
-            lower_mapping - 20,
-        )
-        p.multi_line(p_x, p_y, line_dash="solid", color="red", line_width=1)
-        # Horizontal lines
-        p_x, p_y = hlines(
-            lower_mapping,
-            slim_bmf["start_time"].where(slim_bmf["strand"] == "+").dropna(),
-            slim_bmf["end_time"].where(slim_bmf["strand"] == "+").dropna(),
-        )
-        p.multi_line(p_x, p_y, line_dash="solid", color="blue", line_width=1)
-        # Horizontal lines
-        p_x, p_y = hlines(
-            lower_mapping,
-            slim_bmf["start_time"].where(slim_bmf["strand"] == "-").dropna(),
-            slim_bmf["end_time"].where(slim_bmf["strand"] == "-").dropna(),
-        )
-        p.multi_line(p_x, p_y, line_dash="solid", color="red", line_width=1)
-
-    if wdg["toggle_y_axis"].active:
-        p.y_range = Range1d(int(wdg["po_y_min"].value), int(wdg["po_y_max"].value))
-    if wdg["toggle_annotations"].active:
-        # Map modal_classifications onto df
-        app_data["label_df"]["mc_active_map"] = app_data["label_df"][
-            "modal_classification"
-        ].map(app_data["label_mp"])
-        app_data["label_df"]["mc_label_map"] = app_data["label_df"][
-            "modal_classification"
-        ].map(app_data["label_dt"])
-        # Here labels are thinned out
-        slim_label_df = app_data["label_df"][
-            (app_data["label_df"]["read_start"] >= app_vars["start_time"])
-            & (app_data["label_df"]["read_start"] <= app_vars["end_time"])
-        ]
-        # Use pd.isin to remove unwanted annotations from the slimmed df
-        slim_label_df = slim_label_df[
-            slim_label_df["mc_active_map"].isin(wdg["label_filter"].active) == True
-        ]
+        keep = np.isin(annotations.codes[lo:hi], active_codes)
+        label_x = annotations.times[lo:hi][keep]
+        if len(label_x) > n_labels:
+            bins, label_t = bin_label_text(
+                *event_bins(
+                    label_x,
+                    annotations.codes[lo:hi][keep],
+                    start,
+                    end,
+                    n_labels,
+                ),
+                annotations.labels,
+            )
+            label_x = start + bins * bin_width
+        else:
+            label_t = annotations.label_text(lo, hi)[keep]
         # get coordinates and vstack them to produce [[x, x], [x, x]...]
-        line_x_values = np.vstack(
-            (slim_label_df["read_start"].values, slim_label_df["read_start"].values)
-        ).T
+        line_x_values = np.vstack((label_x, label_x)).T
         tmp_list = np.full((1, len(line_x_values)), -10000)
         line_y_values = np.vstack((tmp_list, tmp_list * -1)).T
-        # Add all vertical lines as multi_line
-        p.multi_line(
-            line_x_values.tolist(),
-            line_y_values.tolist(),
-            line_dash="dashed",
-            color="green",
-            line_width=1,
-        )
-        # combine series to form label
-        slim_label_df["label"] = (
-            slim_label_df["mc_label_map"]
-            + " - "
-            + slim_label_df["read_id"].astype("str")
-        )
-        # Create ColumnDataSource combining labels and coordinates
-        label_source = ColumnDataSource(
-            data=dict(
-                x=slim_label_df["read_start"].values,
-                y=np.full((len(slim_label_df), 1), int(wdg["label_height"].value)),
-                t=slim_label_df["label"].values,
-            )
-        )
-        # Add all labels as a label set
-        labels = LabelSet(
-            x="x",
-            y="y",
-            text="t",
-            level="glyph",
-            x_offset=0,
-            y_offset=0,
-            source=label_source,
-            render_mode="canvas",
-            angle=-270,
-            angle_units="deg",
+        sources["annotation_lines"].data = {
+            "xs": line_x_values.tolist(),
+            "ys": line_y_values.tolist(),
+        }
+        # Combine labels and coordinates
+        sources["annotation_labels"].data = dict(
+            x=label_x,
+            y=np.full(len(label_x), int(wdg["label_height"].value)),
+            t=label_t,
         )
-        p.add_layout(labels)
-
-    return column(p, css_classes=["plot_div"])
 
 
 def is_input_int(attr, old, new):
@@ -939,12 +1658,19 @@ def is_input_int(attr, old, new):
 
 
 def toggle_button(state):
-    layout.children[1] = create_figure(
-        app_data["x_data"],
-        app_data["y_data"],
-        app_data["wdg_dict"],
-        app_data["app_vars"],
-    )
+    """Redraw the single channel figure with the current widget state"""
+    if app_data["app_vars"].get("channels") or "signal" not in app_data:
+        # The stack only draws signal, see apply_stack, and is redrawn by update
+        return
+    update_figure(app_data["signal"], app_data["wdg_dict"], app_data["app_vars"])
+
+
+def position_channels():
+    """Return the channel part of the position, the channel list for a stack"""
+    app_vars = app_data["app_vars"]
+    if app_vars.get("channels"):
+        return app_vars["channels_spec"]
+    return app_vars["channel_num"]
 
 
 def input_error(widget, mode):
@@ -958,26 +1684,102 @@ def input_error(widget, mode):
         print("mode not recognised")
 
 
+def plot_pixels():
+    """Return the plot width in pixels if smoothing is on, otherwise None"""
+    wdg = app_data["wdg_dict"]
+    if "toggle_smoothing" not in wdg:
+        return int(cfg_po["plot_width"])
+    if wdg["toggle_smoothing"].active:
+        return int(wdg["po_width"].value)
+    return None
+
+
+def update_smoothing(state):
+    request_view(plot_pixels())
+
+
 def update():
-    update_data(app_data["bulkfile"], app_data["app_vars"])
-    if app_data["INIT"]:
-        build_widgets()
-        layout.children[0] = column(
-            list(app_data["wdg_dict"].values()), width=int(cfg_po["wdg_width"])
+    if not app_data["INIT"] and not app_data["wdg_dict"]["toggle_smoothing"].active:
+        # Turning smoothing back on reloads the data and redraws the figure
+        app_data["wdg_dict"]["toggle_smoothing"].active = True
+        return
+    request_view(plot_pixels())
+
+
+def request_view(n_pixels):
+    """Load the stacked channels if a channel list was entered, otherwise one channel"""
+    if app_data["app_vars"].get("channels"):
+        # The stack is always decimated, every channel is read at once
+        request_stack(n_pixels or int(cfg_po["plot_width"]))
+    else:
+        request_data(n_pixels)
+
+
+def toggle_live(state):
+    """Start or stop following the end of the bulk file"""
+    if state and app_data["live"] is None:
+        # The sidecar describes the file as it was indexed, not as it grows
+        if app_data["sidecar"] is not None:
+            load_executor.submit(release_files, app_data["sidecar"])
+            app_data["sidecar"] = None
+        app_data["live"] = doc.add_periodic_callback(
+            live_update, int(cfg_li["refresh_ms"])
         )
-        app_data["INIT"] = False
-    app_data["wdg_dict"]["duration"].text = "Duration: {d} seconds".format(
-        d=app_data["app_vars"]["duration"]
-    )
-    app_data["wdg_dict"]["toggle_smoothing"].active = True
-    layout.children[1] = create_figure(
-        app_data["x_data"],
-        app_data["y_data"],
-        app_data["wdg_dict"],
-        app_data["app_vars"],
+        live_update()
+    elif not state and app_data["live"] is not None:
+        doc.remove_periodic_callback(app_data["live"])
+        app_data["live"] = None
+
+
+def live_update():
+    """Check the bulk file for new data, see apply_live"""
+    if "data" in pending_requests:
+        # still drawing the last update
+        return
+    app_vars = app_data["app_vars"]
+    run_async(
+        "live",
+        partial(
+            refresh_channel,
+            app_data["bulkfile"],
+            app_vars["channel_str"],
+            app_vars["sf"],
+            app_data["annotations"],
+        ),
+        apply_live,
     )
 
 
+def refresh_channel(bulkfile, channel_str, sf, annotations):
+    """Return the number of samples in a channel and its annotations, refreshed from disk"""
+    n_samples = refresh_dataset(signal_dataset(bulkfile, channel_str)).shape[0]
+    return n_samples, extend_channel_annotations(bulkfile, channel_str, sf, annotations)
+
+
+def apply_live(refreshed):
+    """Scroll the window to the end of the signal and draw any new annotations"""
+    n_samples, annotations = refreshed
+    app_vars = app_data["app_vars"]
+    app_vars["len_ds"] = n_samples / app_vars["sf"]
+    new_annotations = annotations is not app_data["annotations"]
+    if new_annotations:
+        app_data["annotation_index"][app_vars["channel_str"]] = annotations
+        app_data["annotations"] = annotations
+        app_data["label_dt"] = OrderedDict(annotations.labels)
+        # rebuilt on the next read id lookup, to include new reads
+        app_data["read_index"] = None
+    end_time = n_samples // app_vars["sf"]
+    if end_time > app_vars["end_time"]:
+        # Setting the position parses it and loads the new end of the signal
+        app_data["wdg_dict"]["position"].value = "{ch}:{start}-{end}".format(
+            ch=position_channels(),
+            start=max(end_time - app_vars["duration"], 0),
+            end=end_time,
+        )
+    elif new_annotations:
+        toggle_button(None)
+
+
 def update_other(attr, old, new):
     update()
 
@@ -989,81 +1791,60 @@ def update_toggle(attr, old, new):
         )
     elif new == 1:
         app_data["wdg_dict"]["label_filter"].active = []
-    update()
+    toggle_button(None)
 
 
 def update_checkboxes(attr, old, new):
     if len(new) != len(app_data["wdg_dict"]["label_filter"].labels) and len(new) != 0:
         app_data["wdg_dict"]["filter_toggle_group"].active = None
-    update()
+    # Filtering annotations only redraws, the signal is unchanged
+    toggle_button(None)
 
 
 def next_update(value):
     value = int(value.item)
-    jump_start = app_data["label_df"][
-        (app_data["label_df"]["read_start"] > app_data["app_vars"]["start_time"] + 1)
-        & (app_data["label_df"]["modal_classification"] == value)
-    ]
-    try:
-        app_data["app_vars"]["start_time"] = int(
-            math.floor(jump_start["read_start"].iloc[0])
-        )
-    except IndexError:
+    app_data["app_vars"]["jump_code"] = value
+    jump_start = app_data["annotations"].next_event(
+        value, app_data["app_vars"]["start_time"] + 1
+    )
+    if jump_start is None:
         app_data["wdg_dict"]["duration"].text += "\n{ev} event not found".format(
             ev=app_data["label_dt"][value]
         )
         return
-    except Exception as e:
-        print(type(e))
-        print(e)
+    app_data["app_vars"]["start_time"] = int(math.floor(jump_start))
     app_data["app_vars"]["end_time"] = (
         app_data["app_vars"]["start_time"] + app_data["app_vars"]["duration"]
     )
+    # Setting the position parses it and updates the plot
     app_data["wdg_dict"]["position"].value = "{ch}:{start}-{end}".format(
-        ch=app_data["app_vars"]["channel_num"],
+        ch=position_channels(),
         start=app_data["app_vars"]["start_time"],
         end=app_data["app_vars"]["end_time"],
     )
-    layout.children[1] = create_figure(
-        app_data["x_data"],
-        app_data["y_data"],
-        app_data["wdg_dict"],
-        app_data["app_vars"],
-    )
 
 
 def prev_update(value):
     value = int(value.item)
-    jump_start = app_data["label_df"][
-        (app_data["label_df"]["read_start"] < app_data["app_vars"]["start_time"])
-        & (app_data["label_df"]["modal_classification"] == value)
-    ]
-    try:
-        app_data["app_vars"]["start_time"] = int(
-            math.floor(jump_start["read_start"].iloc[-1])
-        )
-    except IndexError:
+    app_data["app_vars"]["jump_code"] = value
+    jump_start = app_data["annotations"].previous_event(
+        value, app_data["app_vars"]["start_time"]
+    )
+    if jump_start is None:
         app_data["wdg_dict"]["duration"].text += "\n{ev} event not found".format(
             ev=app_data["label_dt"][value]
         )
         return
-    except Exception as e:
-        print(type(e))
-        print(e)
+    app_data["app_vars"]["start_time"] = int(math.floor(jump_start))
     app_data["app_vars"]["end_time"] = (
         app_data["app_vars"]["start_time"] + app_data["app_vars"]["duration"]
     )
+    # Setting the position parses it and updates the plot
     app_data["wdg_dict"]["position"].value = "{ch}:{start}-{end}".format(
-        ch=app_data["app_vars"]["channel_num"],
+        ch=position_channels(),
         start=app_data["app_vars"]["start_time"],
         end=app_data["app_vars"]["end_time"],
     )
-    layout.children[1] = create_figure(
-        app_data["x_data"],
-        app_data["y_data"],
-        app_data["wdg_dict"],
-        app_data["app_vars"],
-    )
 
 
 def export_data():
@@ -1075,16 +1856,22 @@ def export_data():
     except KeyError:
         start_val = app_data["app_vars"]["start_squiggle"]
         end_val = app_data["app_vars"]["end_squiggle"]
-    if (
-        export_read_file(
+    run_async(
+        "export",
+        partial(
+            export_read_file,
             app_data["app_vars"]["channel_num"],
             start_val,
             end_val,
             app_data["bulkfile"],
             cfg_dr["out"],
-        )
-        == 0
-    ):
+        ),
+        apply_export,
+    )
+
+
+def apply_export(status):
+    if status == 0:
         app_data["wdg_dict"]["duration"].text += "\nread file created"
     else:
         app_data["wdg_dict"]["duration"].text += "\nError: read file not created"
@@ -1093,10 +1880,12 @@ def export_data():
 app_data = {
     "file_src": None,  # bulkfile path (string)
     "bulkfile": None,  # bulkfile object
-    "bmf": None,  # bmf dataframe
-    "x_data": None,  # numpy ndarray time points
-    "y_data": None,  # numpy ndarray signal data
-    "label_df": None,  # pandas df of signal labels
+    "sidecar": None,  # sidecar object holding the signal pyramid, if present
+    "bmf": None,  # bmf MappingIndex
+    "signal": None,  # (x start, x step, y) of the loaded signal, see load_signal
+    "annotations": None,  # ChannelAnnotations of the current channel
+    "annotation_index": None,  # dict of ChannelAnnotations by channel
+    "read_index": None,  # ReadIndex of read ids in the bulkfile, built on first use
     "label_dt": None,  # dict of signal enumeration
     "label_mp": None,  # dict matching labels to widget filter
     "app_vars": {  # dict of variables used in plots and widgets
@@ -1106,58 +1895,46 @@ app_data = {
         "duration": None,  # squiggle duration in seconds
         "start_squiggle": None,  # squiggle start position (samples)
         "end_squiggle": None,  # squiggle end position (samples)
+        "level": None,  # pyramid level of the loaded signal, 0 for raw samples
+        "y_limits": None,  # (min, max) of the window from the sidecar, if indexed
         "channel_str": None,  # 'Channel_NNN' (string)
         "channel_num": None,  # Channel number (int)
+        "jump_code": None,  # classification code of the last jump, for read-ahead
         "sf": None,  # sample frequency (int)
         "attributes": None,  # OrderedDict of bulkfile attr info
+        "catalogue": None,  # OrderedDict of bulkfile catalogue entries
     },
     "wdg_dict": None,  # dictionary of widgets
     "controls": None,  # widgets added to widgetbox
     "pore_plt": None,  # the squiggle plot
+    "plot": None,  # dict of the figure and the models updated in place
+    "live": None,  # periodic callback following the end of the file, if live
+    "overview": None,  # dict of the flowcell heatmap and its activity, see create_overview
     "INIT": True,  # Initial plot with bulkfile (bool)
 }
 
+doc = curdoc()
+# Slow work runs on one load thread per session, see run_async
+load_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulkvis-load")
+pending_requests = {}  # name: token of the latest request of that name
+
+# Decoded signal chunks and open bulk files, shared by every session in this process
+signal_cache = shared_cache(int(cfg_ca["signal_mb"]) * 2 ** 20)
+handle_pool = shared_pool(float(cfg_ca["handle_idle_seconds"]))
+stack_reader = shared_reader(int(cfg_st["workers"]))
+# Windows loaded ahead of navigation, in background threads
+read_ahead = ReadAhead(int(cfg_ca["read_ahead"]), int(cfg_ca["read_ahead_workers"]))
+
 int_inputs = ["po_width", "po_height", "po_y_min", "po_y_max", "label_height"]
-toggle_inputs = ["toggle_y_axis", "toggle_annotations", "toggle_smoothing"]
-
-app_data["app_vars"]["files"] = []
-p = Path(cfg_dr["dir"])
-app_data["app_vars"]["files"] = [
-    (x.name, x.name) for x in p.iterdir() if x.suffix == ".fast5"
-]
-m = Path(cfg_dr["map"])
-app_data["app_vars"]["map_files"] = [
-    (x.name, x.name) for x in m.iterdir() if x.suffix == ".bmf"
-]
-app_data["app_vars"]["map_files"].insert(0, ("", "--"))
-# check files are useable by h5py
-for index, file in enumerate(app_data["app_vars"]["files"]):
-    file = file[0]
-    try:
-        bulk_file = h5py.File(Path(Path(cfg_dr["dir"]) / file), "r")
-    except OSError:
-        app_data["app_vars"]["files"][index] = None
-        continue
-    try:
-        try_path = bulk_file["Raw"]
-    except KeyError:
-        app_data["app_vars"]["files"][index] = None
-        continue
-    for i, channel in enumerate(try_path):
-        if i == 0:
-            try:
-                try_path[channel]["Signal"][0]
-            except KeyError:
-                app_data["app_vars"]["files"][index] = None
-        break
-    bulk_file.flush()
-    bulk_file.close()
-app_data["app_vars"]["files"] = list(
-    filter((None).__ne__, app_data["app_vars"]["files"])
-)
-app_data["app_vars"]["files"].insert(0, ("", "--"))
+toggle_inputs = ["toggle_y_axis", "toggle_annotations", "toggle_mappings"]
+
+# The file lists are filled in by apply_file_lists once the catalogue is loaded
+app_data["app_vars"]["catalogue"] = OrderedDict()
+app_data["app_vars"]["files"] = [("", "--")]
+app_data["app_vars"]["map_files"] = [("", "--")]
 
 app_data["wdg_dict"] = init_wdg_dict()
+app_data["wdg_dict"]["file_list"].disabled = True
 app_data["controls"] = column(
     list(app_data["wdg_dict"].values()), width=int(cfg_po["wdg_width"])
 )
@@ -1174,5 +1951,16 @@ app_data["pore_plt"] = column(f, css_classes=["plot_div"])
 
 layout = row(app_data["controls"], app_data["pore_plt"])
 
-curdoc().add_root(layout)
-curdoc().title = "bulkvis"
+
+def close_session(session_context):
+    read_ahead.shutdown()
+    load_executor.submit(release_files, app_data["bulkfile"], app_data["sidecar"])
+    load_executor.shutdown(wait=False)
+
+
+doc.add_root(layout)
+doc.title = "bulkvis"
+doc.on_session_destroyed(close_session)
+run_async(
+    "catalogue", partial(load_file_lists, cfg_dr["dir"], cfg_dr["map"]), apply_file_lists
+)
@@ -0,0 +1,113 @@
+"""cache.py
+
+Byte-budgeted least recently used cache for decoded signal chunks, with a
+process-wide instance shared by viewer sessions
+"""
+from collections import OrderedDict
+import sys
+import threading
+
+from bulkvis.core import human_readable_yield
+
+
+class ChunkCache:
+    """LRU cache of numpy arrays that evicts the oldest entries once max_bytes is exceeded
+    Parameters
+    ----------
+    max_bytes : int
+        Memory budget for cached arrays, in bytes
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        """Return the array cached under key, marking it recently used, or None"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache an array under key, evicting least recently used arrays to stay in budget"""
+        if value.nbytes > self.max_bytes:
+            return value
+        value.flags.writeable = False
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._data[key] = value
+            self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        """Remove all cached arrays, keeping the counters"""
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Return a dict of cache counters and memory use"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._data),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def __str__(self):
+        s = self.stats()
+        return "{h} hits, {m} misses ({r:.1%}), {e} evictions, {u} of {b} used".format(
+            h=s["hits"],
+            m=s["misses"],
+            r=s["hit_rate"],
+            e=s["evictions"],
+            u=human_readable_yield(s["nbytes"], factor=1024, suffix="iB"),
+            b=human_readable_yield(s["max_bytes"], factor=1024, suffix="iB"),
+        )
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache(max_bytes):
+    """Return the process-wide ChunkCache, created with max_bytes on first use
+
+    Chunks are keyed by file name, so every session viewing a file shares them.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ChunkCache(max_bytes)
+        return _shared
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: cache is not directly executable")
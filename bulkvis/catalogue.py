@@ -0,0 +1,197 @@
+"""catalogue.py
+
+Persistent catalogue of the bulk FAST5 files in a directory. Each file is
+probed once and the results are kept in a sidecar index, keyed by file name,
+size and modification time, so only new or changed files are opened again.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+
+from bulkvis.bulkfile import open_bulk
+
+LOGGER = logging.getLogger(__name__)
+
+CATALOGUE_NAME = ".bulkvis_catalogue.json"
+CATALOGUE_VERSION = 1
+
+# Attributes shown in the viewer: {group in UniqueGlobalKey: [(label, attribute), ...]}
+BULKFILE_ATTRIBUTES = OrderedDict(
+    [
+        (
+            "tracking_id",
+            [
+                ("Experiment", "sample_id"),
+                ("Flowcell ID", "flow_cell_id"),
+                ("MinKNOW version", "version"),
+                ("Protocols version", "protocols_version"),
+                ("MinION ID", "device_id"),
+                ("Hostname", "hostname"),
+                ("Run ID", "run_id"),
+                ("ASIC ID", "asic_id"),
+                ("Experiment start", "exp_start_time"),
+            ],
+        ),
+        (
+            "context_tags",
+            [
+                ("Sequencing kit", "sequencing_kit"),
+                ("Flowcell type", "flowcell_type"),
+            ],
+        ),
+    ]
+)
+
+
+def _decode(value):
+    """Return an HDF5 string attribute as str"""
+    if isinstance(value, bytes):
+        return value.decode("utf8")
+    return str(value)
+
+
+def _empty_metadata():
+    """Return the metadata recorded for a file that is not a usable bulk FAST5 file"""
+    return {
+        "valid": False,
+        "sample_frequency": None,
+        "channels": 0,
+        "signal_length": 0,
+        "attributes": {},
+    }
+
+
+def read_metadata(bulkfile):
+    """Return the catalogue metadata of an open bulk FAST5 file
+    Parameters
+    ----------
+    bulkfile : h5py.File
+        An open bulk FAST5 file
+    Returns
+    -------
+    dict
+        Keys are 'valid', 'sample_frequency', 'channels', 'signal_length' and
+        'attributes'; attributes is {group: {attribute: value}} for the entries
+        in BULKFILE_ATTRIBUTES that are present in the file
+    """
+    metadata = _empty_metadata()
+    try:
+        raw = bulkfile["Raw"]
+        first_channel = next(iter(raw))
+        signal = raw[first_channel]["Signal"]
+        signal[0]
+    except (KeyError, StopIteration, ValueError, OSError):
+        return metadata
+    metadata["valid"] = True
+    metadata["channels"] = len(raw)
+    metadata["signal_length"] = int(signal.shape[0])
+    try:
+        metadata["sample_frequency"] = int(
+            _decode(
+                bulkfile["UniqueGlobalKey"]["context_tags"].attrs["sample_frequency"]
+            )
+        )
+    except (KeyError, ValueError):
+        pass
+    for group, attributes in BULKFILE_ATTRIBUTES.items():
+        values = {}
+        for _, attribute in attributes:
+            try:
+                values[attribute] = _decode(
+                    bulkfile["UniqueGlobalKey"][group].attrs[attribute]
+                )
+            except KeyError:
+                continue
+        metadata["attributes"][group] = values
+    return metadata
+
+
+def probe_bulkfile(path):
+    """Open a bulk FAST5 file and return its catalogue metadata, see read_metadata"""
+    try:
+        with open_bulk(path) as bulkfile:
+            return read_metadata(bulkfile)
+    except OSError:
+        return _empty_metadata()
+
+
+def _file_key(path):
+    """Return the (size, mtime) pair used to detect changed files"""
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_catalogue(directory, workers=None):
+    """Return the catalogue of bulk FAST5 files in a directory
+    Files that are new, or whose size or modification time changed since the
+    sidecar index was written, are probed in parallel and the index is updated.
+    Parameters
+    ----------
+    directory : str
+        Directory containing bulk FAST5 files
+    workers : int
+        Maximum number of processes used to probe files, defaults to the CPU count
+    Returns
+    -------
+    OrderedDict
+        {file name: entry} sorted by file name, each entry is the metadata from
+        read_metadata plus the 'size' and 'mtime' it was recorded with
+    """
+    directory = Path(directory)
+    index_path = directory / CATALOGUE_NAME
+    try:
+        with index_path.open() as fh:
+            index = json.load(fh)
+        if index.get("version") != CATALOGUE_VERSION:
+            index = {}
+    except (OSError, ValueError):
+        index = {}
+    cached = index.get("files", {})
+
+    files = {}
+    stale = []
+    for path in directory.iterdir():
+        if path.suffix != ".fast5":
+            continue
+        try:
+            size, mtime = _file_key(path)
+        except OSError:
+            continue
+        entry = cached.get(path.name)
+        if entry is not None and entry["size"] == size and entry["mtime"] == mtime:
+            files[path.name] = entry
+        else:
+            stale.append((path, size, mtime))
+
+    if stale:
+        LOGGER.info(f"Probing {len(stale)} bulk FAST5 file(s) in {directory}")
+        if len(stale) == 1:
+            results = [probe_bulkfile(stale[0][0])]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(probe_bulkfile, [s[0] for s in stale]))
+        for (path, size, mtime), metadata in zip(stale, results):
+            files[path.name] = dict(metadata, size=size, mtime=mtime)
+
+    if stale or len(files) != len(cached):
+        _write_index(index_path, files)
+    return OrderedDict(sorted(files.items()))
+
+
+def _write_index(index_path, files):
+    """Atomically write the sidecar index, logging rather than failing if the directory is read-only"""
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    try:
+        with tmp_path.open("w") as fh:
+            json.dump({"version": CATALOGUE_VERSION, "files": files}, fh)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        LOGGER.warning(f"Could not write bulk file catalogue {index_path}: {e}")
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: catalogue is not directly executable")
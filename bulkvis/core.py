@@ -1,18 +1,63 @@
 """core.py
 """
+from multiprocessing import Pool
 from pathlib import Path
 import sys
 import numpy as np
 import pandas as pd
-import traceback
-
-
-def concat_files_to_df(file_list, **kwargs):
+from tqdm import tqdm
+
+# Channel blocks per worker process in a parallel fuse, for load balancing
+FUSE_BLOCKS_PER_THREAD = 4
+
+# Dtypes of the sequencing summary columns read by bulkvis. Times stay float64,
+# they are seconds since the start of runs lasting days, past float32 precision.
+# Integer columns are read as nullable, see _compact_integers
+SUMMARY_DTYPES = {
+    "channel": "Int16",
+    "start_time": "float64",
+    "duration": "float64",
+    "run_id": "category",
+    "sequence_length_template": "Int32",
+}
+# Names of the PAF columns read by bulkvis, by column index, and their dtypes
+PAF_COLUMNS = {0: "Qname", 4: "Strand", 5: "Tname", 7: "Tstart", 8: "Tend"}
+PAF_DTYPES = {
+    "Strand": "category",
+    "Tname": "category",
+    "Tstart": "Int32",
+    "Tend": "Int32",
+}
+
+
+class InputFileError(Exception):
+    """An input file could not be read, the message starts with the file name"""
+
+
+def _read_csv_file(task):
+    """Return pandas.read_csv(path, **kwargs) for a (path, kwargs) task, run in a worker"""
+    f, kwargs = task
+    try:
+        return pd.read_csv(filepath_or_buffer=f, **kwargs)
+    except pd.errors.ParserError as e:
+        raise InputFileError(
+            f"{f}: ParserError, usually caused by an input file not being the expected "
+            f"format\n{e}"
+        ) from e
+    except Exception as e:
+        raise InputFileError(f"{f}: {type(e).__name__}: {e}") from e
+
+
+def concat_files_to_df(file_list, threads=1, **kwargs):
     """Return a pandas.DataFrame from a list of files
+    Files are parsed concurrently by a pool of worker processes and
+    concatenated in the order given, progress is shown for more than one file.
     Parameters
     ----------
     file_list : list
         List of files to be concatenated
+    threads : int
+        Number of worker processes parsing files
     kwargs
         Any parameter used by pandas.read_csv except 'filepath_or_buffer'. These will be applied to all
         files in 'file_list'
@@ -21,22 +66,116 @@ def concat_files_to_df(file_list, **kwargs):
     pandas.DataFrame
     Raises
     ------
-    pandas.errors.ParserError
-        Raises pandas.errors.ParserError if input file(s) do not match expected format or shape.
+    InputFileError
+        Raises InputFileError, naming the file, if an input file cannot be read or does not match
+        the expected format or shape.
     """
     kwargs = remove_kwargs(["filepath_or_buffer"], **kwargs)
-    df_list = []
-    for f in file_list:
-        try:
-            df_list.append(pd.read_csv(filepath_or_buffer=f, **kwargs))
-        except pd.errors.ParserError as e:
-            sys.exit(
-                "ParserError\nUsually caused by an input file not being the expected format"
-            )
-        except Exception as e:
-            traceback.print_exc()
-            sys.exit(1)
-    return pd.concat(df_list, ignore_index=True)
+    tasks = [(f, kwargs) for f in file_list]
+    progress = dict(total=len(tasks), desc="Files read", disable=len(tasks) < 2)
+    if threads > 1 and len(tasks) > 1:
+        with Pool(processes=min(threads, len(tasks))) as pool:
+            df_list = list(tqdm(pool.imap(_read_csv_file, tasks), **progress))
+    else:
+        df_list = [_read_csv_file(task) for task in tqdm(tasks, **progress)]
+    return pd.concat(_union_categories(df_list), ignore_index=True)
+
+
+def _union_categories(df_list):
+    """Return the DataFrames with the categories of each categorical column unified
+
+    pandas.concat only keeps a column categorical when its categories match in
+    every frame.
+    """
+    if len(df_list) < 2:
+        return df_list
+    first = df_list[0]
+    columns = [c for c in first.columns if isinstance(first[c].dtype, pd.CategoricalDtype)]
+    for c in columns:
+        if not all(isinstance(df[c].dtype, pd.CategoricalDtype) for df in df_list):
+            continue
+        categories = pd.api.types.union_categoricals(
+            [df[c] for df in df_list], sort_categories=True
+        ).categories
+        df_list = [df.assign(**{c: df[c].cat.set_categories(categories)}) for df in df_list]
+    return df_list
+
+
+def read_summaries(file_list, columns, threads=1):
+    """Return columns of sequencing summary files with the dtypes of SUMMARY_DTYPES
+    Parameters
+    ----------
+    file_list : list
+        Sequencing summary files, can be compressed
+    columns : list
+        Names of the columns to read, those not in SUMMARY_DTYPES are inferred
+    threads : int
+        See concat_files_to_df
+    Returns
+    -------
+    pandas.DataFrame
+    Raises
+    ------
+    InputFileError
+        See concat_files_to_df
+    """
+    df = concat_files_to_df(
+        file_list=file_list,
+        threads=threads,
+        sep="\t",
+        usecols=columns,
+        dtype={c: SUMMARY_DTYPES[c] for c in columns if c in SUMMARY_DTYPES},
+    )
+    return _compact_integers(df)
+
+
+def read_pafs(file_list, threads=1):
+    """Return the PAF_COLUMNS of minimap2 PAF files with the dtypes of PAF_DTYPES
+    Parameters
+    ----------
+    file_list : list
+        PAF files, can be compressed
+    threads : int
+        See concat_files_to_df
+    Returns
+    -------
+    pandas.DataFrame
+        With columns 'Qname', 'Strand', 'Tname', 'Tstart' and 'Tend'
+    Raises
+    ------
+    InputFileError
+        See concat_files_to_df
+    """
+    df = concat_files_to_df(
+        file_list=file_list,
+        threads=threads,
+        sep="\t",
+        header=None,
+        usecols=list(PAF_COLUMNS),
+        names=list(PAF_COLUMNS.values()),
+        dtype=PAF_DTYPES,
+    )
+    return _compact_integers(df)
+
+
+def _compact_integers(df):
+    """Return df with its nullable integer columns cast to numpy dtypes
+    Columns without missing values keep their width, those with missing values
+    become float64 with NaN, as pandas infers them, so rows with blank fields
+    are dropped by fuse_reads as before.
+    """
+    for c in df.columns:
+        dtype = df[c].dtype
+        if not (
+            pd.api.types.is_extension_array_dtype(dtype)
+            and pd.api.types.is_integer_dtype(dtype)
+        ):
+            continue
+        if df[c].isna().any():
+            df[c] = df[c].astype("float64")
+        else:
+            df[c] = df[c].astype(dtype.numpy_dtype)
+    return df
 
 
 def remove_kwargs(remove_list, **kwargs):
@@ -173,7 +312,259 @@ def find_files_of_type(file_or_directory, file_extensions):
         return []
 
 
-def fuse_reads(seq_sum_df, paf_df, distance=10000, alt=True):
+def _expand(counts):
+    """Return (group, position) of each item when groups of counts[i] items are laid end to end"""
+    group = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(len(group)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return group, position
+
+
+def _consecutive_mapping_pairs(seq_sum_df, paf_df):
+    """Return positional indexes of every (read, read mapping, next read mapping) triple
+    This is the inner join of seq_sum_df with paf_df on read_id, then on
+    next_read_id, done with integer codes for the read ids instead of merging
+    on strings. Rows with missing values in either frame, and reads followed by
+    the same read id, are skipped. The triples are in the order the equivalent
+    pandas merges give, which group rows by key in order of first appearance:
+    by next_read_id, then read_id, then row, then the position of each mapping
+    in paf_df. Without repeated read ids this is the order of seq_sum_df.
+    Parameters
+    ----------
+    seq_sum_df : pandas.DataFrame
+        Sorted sequencing summary with 'read_id' and 'next_read_id' columns
+    paf_df : pandas.DataFrame
+        Mappings with a 'Qname' column
+    Returns
+    -------
+    tuple
+        (reads, map_a, map_b) numpy.ndarray of positions in seq_sum_df and paf_df
+    """
+    # One set of codes shared by the read ids and the mapped query names
+    codes, uniques = pd.factorize(
+        pd.concat([seq_sum_df["read_id"], paf_df["Qname"]], ignore_index=True)
+    )
+    read_codes, query_codes = codes[: len(seq_sum_df)], codes[len(seq_sum_df) :]
+    next_codes = np.append(read_codes[1:], -1)
+
+    # Mappings with no missing values, grouped by query code in paf_df order
+    mapped = np.flatnonzero(paf_df.notna().all(axis=1).to_numpy() & (query_codes >= 0))
+    by_query = mapped[np.argsort(query_codes[mapped], kind="stable")]
+    n_mappings = np.bincount(query_codes[mapped], minlength=len(uniques) + 1)
+    first_mapping = np.cumsum(n_mappings) - n_mappings
+    # Code -1 (no read id) has no mappings
+    n_mappings[-1] = 0
+
+    # Row order of the merge on read_id, then of the merge on next_read_id
+    order = np.argsort(pd.factorize(read_codes)[0], kind="stable")
+    order = order[np.argsort(pd.factorize(next_codes[order])[0], kind="stable")]
+    # Reads with no missing values (the last has no successor) followed by a
+    # different read
+    valid = seq_sum_df.notna().all(axis=1).to_numpy()
+    valid &= (next_codes >= 0) & (next_codes != read_codes)
+    candidates = order[valid[order]]
+    read_rows, a_pos = _expand(n_mappings[read_codes[candidates]])
+    reads = candidates[read_rows]
+    map_a = by_query[first_mapping[read_codes[reads]] + a_pos]
+    pair_rows, b_pos = _expand(n_mappings[next_codes[reads]])
+    reads, map_a = reads[pair_rows], map_a[pair_rows]
+    map_b = by_query[first_mapping[next_codes[reads]] + b_pos]
+    return reads, map_a, map_b
+
+
+def _assemble_chains(pairs, alt=True):
+    """Return one row per chain of consecutive, adjacently mapped, reads
+    Pairs are split into chains after each row that shares no read id with
+    the row after it, and, if alt is set, by target. Chains are aggregated
+    with segment reductions over the pairs sorted by chain, and the
+    concatenated read ids are only built for the rows returned.
+    Parameters
+    ----------
+    pairs : pandas.DataFrame
+        Consecutive read pairs, see fuse_reads
+    alt : bool
+        Split chains by target, so reads mapping to alternate assemblies form
+        separate chains
+    Returns
+    -------
+    pandas.DataFrame
+        The first pair of each chain and channel, with the chain's
+        coordinates, lengths and read ids
+    """
+    n = len(pairs)
+    read_ids = pairs["read_id"].to_numpy()
+    next_ids = pairs["next_read_id"].to_numpy()
+    # A chain ends after each pair that shares no read id with the next pair
+    linked = (next_ids[:-1] == read_ids[1:]) | (read_ids[:-1] == next_ids[1:])
+    cs = np.concatenate([[0], np.cumsum(~linked)]) if n else np.zeros(0, int)
+    if alt:
+        targets, _ = pd.factorize(pairs["Tname_B"])
+        _, chain = np.unique(cs * (targets.max() + 1) + targets, return_inverse=True)
+    else:
+        chain = cs
+
+    # Pairs sorted by chain, keeping their order within each chain
+    order = np.argsort(chain, kind="stable")
+    starts = np.flatnonzero(np.diff(chain[order], prepend=-1))
+    ends = np.append(starts[1:], n) - 1
+    size = ends - starts + 1
+    combined_length = (
+        np.add.reduceat(pairs["sequence_length_template"].to_numpy()[order], starts)
+        + pairs["next_sequence_length_template"].to_numpy()[order][ends]
+    )
+    matches = pairs[["Tstart_A", "Tstart_B", "Tend_A", "Tend_B"]].to_numpy()
+    start_match = np.minimum.reduceat(matches.min(axis=1)[order], starts)
+    end_match = np.maximum.reduceat(matches.max(axis=1)[order], starts)
+    start_time = pairs["start_time"].to_numpy()[order][starts]
+    next_end = pairs["next_end"].to_numpy()[order][ends]
+
+    # Keep the first pair of each chain and channel
+    channels, _ = pd.factorize(pairs["channel"])
+    _, first = np.unique(chain * (channels.max() + 1) + channels, return_index=True)
+    rows = np.sort(first)
+    df = pairs.iloc[rows].reset_index(drop=True)
+    groups, inverse = np.unique(chain[rows], return_inverse=True)
+    chain_read_ids = read_ids[order].tolist()
+    last_read_ids = next_ids[order][ends]
+    chain_ids = np.array(
+        [
+            "|".join(chain_read_ids[starts[g] : ends[g] + 1]) + "|" + last_read_ids[g]
+            for g in groups
+        ],
+        dtype=object,
+    )
+    g = chain[rows]
+    df["cat_read_id"] = chain_ids[inverse]
+    df["combined_length"] = combined_length[g].astype("int64")
+    df["start_time"] = start_time[g]
+    df["next_end"] = next_end[g]
+    # add the duration (time between start and end)
+    df["duration"] = df["next_end"] - df["start_time"]
+
+    # format and add coordinates
+    df["stime_floor"] = np.floor(df["start_time"]).astype("int64").astype("str")
+    df["etime_ceil"] = np.ceil(df["next_end"]).astype("int64").astype("str")
+    df["channel"] = df["channel"].astype("int64").astype("str")
+    df["start_match"] = start_match[g].astype("int64").astype("str")
+    df["end_match"] = end_match[g].astype("int64").astype("str")
+    df["duration"] = df["duration"].map("{:.5f}".format)
+    df["coords"] = df["channel"] + ":" + df["stime_floor"] + "-" + df["etime_ceil"]
+    df["count"] = size[g] + 1
+
+    # rename cols for export
+    df.rename(columns={"Tname_A": "target_name", "Strand_A": "strand"}, inplace=True)
+
+    # remove duplicate entries, chains with the same reads and coordinates
+    return df.drop_duplicates(
+        subset=[
+            "coords",
+            "channel",
+            "start_time",
+            "duration",
+            "combined_length",
+            "start_match",
+            "end_match",
+            "cat_read_id",
+        ],
+        keep="first",
+    )
+
+
+def _read_pairs(seq_sum_df, paf_df, distance):
+    """Return consecutive reads with mappings on the same strand and target within distance
+    Parameters
+    ----------
+    seq_sum_df : pandas.DataFrame
+        Sorted sequencing summary with the next_* columns added by fuse_reads
+    paf_df : pandas.DataFrame
+        Mappings, see fuse_reads
+    distance : int
+        See fuse_reads
+    Returns
+    -------
+    pandas.DataFrame
+        One row per (read, mapping, next read mapping), with the seq_sum_df
+        columns followed by the paf_df columns of each mapping suffixed with
+        '_A' and '_B'. Empty if no reads pair
+    """
+    # Join each read's mappings (A) with its successor's mappings (B) on integer
+    # codes; only pairs passing the strand, target and distance filters are
+    # materialized
+    reads, map_a, map_b = _consecutive_mapping_pairs(seq_sum_df, paf_df)
+    strand_codes, strands = pd.factorize(paf_df["Strand"])
+    target_codes, _ = pd.factorize(paf_df["Tname"])
+    # Condition where Strand matches
+    yes_strand = strand_codes[map_a] == strand_codes[map_b]
+    # Condition where Target (chromosome) matches
+    yes_tname = target_codes[map_a] == target_codes[map_b]
+
+    keep = yes_strand & yes_tname
+    reads, map_a, map_b = reads[keep], map_a[keep], map_b[keep]
+
+    t_start = paf_df["Tstart"].to_numpy()
+    t_end = paf_df["Tend"].to_numpy()
+    plus = strands.get_loc("+") if "+" in strands else -1
+    match_distance = np.where(
+        strand_codes[map_a] == plus,  # Where: Strand is '+'
+        t_start[map_b] - t_end[map_a],  # True:  read_2_start - read_1_end
+        t_start[map_a] - t_end[map_b],  # False: read_1_start - read_2_end
+    )
+    # Remove reads outside of the distance parameter
+    keep = (match_distance > 0) & (match_distance < distance)
+
+    df2 = pd.concat(
+        [
+            seq_sum_df.iloc[reads[keep]].reset_index(drop=True),
+            paf_df.iloc[map_a[keep]].reset_index(drop=True).add_suffix("_A"),
+            paf_df.iloc[map_b[keep]].reset_index(drop=True).add_suffix("_B"),
+        ],
+        axis=1,
+    )
+    df2["match_distance"] = match_distance[keep]
+    return df2
+
+
+def _parallel_read_pairs(seq_sum_df, paf_df, distance, threads):
+    """Return _read_pairs computed for blocks of whole channels in a process pool
+
+    Each block also holds the read after it, the successor of its last read,
+    so the pairs are those of the serial path, in the same order. The read ids
+    of seq_sum_df must be unique.
+    """
+    n = len(seq_sum_df)
+    channel = seq_sum_df["channel"].to_numpy()
+    channel_starts = np.flatnonzero(np.r_[True, channel[1:] != channel[:-1]])
+    targets = np.arange(1, threads * FUSE_BLOCKS_PER_THREAD) * n // (
+        threads * FUSE_BLOCKS_PER_THREAD
+    )
+    bounds = channel_starts[
+        np.minimum(np.searchsorted(channel_starts, targets), len(channel_starts) - 1)
+    ]
+    bounds = np.unique(np.r_[0, bounds, n])
+
+    # Mappings ordered by the position of their read, keeping paf_df order per read
+    position = pd.Index(seq_sum_df["read_id"]).get_indexer(paf_df["Qname"])
+    mapped = np.flatnonzero(position >= 0)
+    mapped = mapped[np.argsort(position[mapped], kind="stable")]
+    position = position[mapped]
+
+    tasks = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        lo = np.searchsorted(position, start, side="left")
+        hi = np.searchsorted(position, end, side="right")
+        tasks.append(
+            (
+                seq_sum_df.iloc[start : end + 1],
+                paf_df.iloc[mapped[lo:hi]],
+                distance,
+            )
+        )
+    with Pool(processes=threads) as pool:
+        parts = pool.starmap(_read_pairs, tasks)
+    found = [part for part in parts if len(part)]
+    return pd.concat(found or parts[:1], ignore_index=True)
+
+
+def fuse_reads(seq_sum_df, paf_df, distance=10000, alt=True, threads=1):
     """Find fused reads from sequencing_summary.txt and paf files
     Parse sequencing_summary.txt and mapping.paf files to infer reads that may
     have been incorrectly split my MinKNOW. This approach is based on read number
@@ -196,6 +587,10 @@ def fuse_reads(seq_sum_df, paf_df, distance=10000, alt=True):
         Include alternate assemblies, default is True. If set to True (include
         alternate assemblies) the 'new' dataset may have more bases than the 'original'
         input dataset due to reads mapping to alternate contigs.
+    threads : int
+        Number of worker processes joining reads to their mappings, split by
+        channel. The results do not depend on the number of threads. Summaries
+        with repeated read ids are always joined in a single process
     Returns
     -------
     fused_reads_df : pandas.DataFrame
@@ -232,44 +627,10 @@ def fuse_reads(seq_sum_df, paf_df, distance=10000, alt=True):
         seq_sum_df["combined_length"].fillna(0).astype("int64")
     )
 
-    # Merge seq_sum_df and paf_df on read_id/Qname; this aligns the read and the mapping information
-    df = pd.merge(seq_sum_df, paf_df, left_on="read_id", right_on="Qname", how="outer")
-    # Merge df with paf_df on next_read_id/Qname; this aligns each read with it's
-    # successor giving suffix '_A' and '_B' respectively
-    df2 = pd.merge(
-        df,
-        paf_df,
-        left_on="next_read_id",
-        right_on="Qname",
-        how="outer",
-        suffixes=("_A", "_B"),
-    )
-    df2 = df2.dropna().reset_index()
-
-    # If df2 had no rows, no merging has taken place
-    if len(df2) == 0:
-        return None, None, None
-
-    # Condition where Qname (read_id) does NOT match
-    not_qname = df2["Qname_A"] != df2["Qname_B"]
-    # Condition where Strand matches
-    yes_strand = df2["Strand_A"] == df2["Strand_B"]
-    # Condition where Target (chromosome) matches
-    yes_tname = df2["Tname_A"] == df2["Tname_B"]
-
-    df2 = df2[not_qname & yes_strand & yes_tname]
-
-    # End program if no rows
-    if len(df2) == 0:
-        return None, None, None
-
-    df2["match_distance"] = np.where(
-        df2["Strand_A"] == "+",  # Where: Strand is '+'
-        df2["Tstart_B"] - df2["Tend_A"],  # True:  read_2_start - read_1_end
-        df2["Tstart_A"] - df2["Tend_B"],  # False: read_1_start - read_2_end
-    )
-    # Remove reads outside of the distance parameter
-    df2 = df2[(df2["match_distance"] > 0) & (df2["match_distance"] < distance)]
+    if threads > 1 and seq_sum_df["read_id"].is_unique:
+        df2 = _parallel_read_pairs(seq_sum_df, paf_df, distance, threads)
+    else:
+        df2 = _read_pairs(seq_sum_df, paf_df, distance)
 
     # End program if no rows
     if len(df2) == 0:
@@ -289,88 +650,11 @@ def fuse_reads(seq_sum_df, paf_df, distance=10000, alt=True):
         ],
         keep="first",
     )
-    # separate df into read groups and set index to cs to allow grouping
-    cond_1 = df2["next_read_id"] == df2["read_id"].shift(-1)
-    cond_2 = df2["read_id"] == df2["next_read_id"].shift(-1)
-    df2["COND"] = np.where(cond_1 | cond_2, True, False)
-    df2["W"] = np.where(df2["COND"].shift(1) == False, 1, 0)
-    df2["cs"] = df2["W"].cumsum()
-
-    """UNDER HERE NOT REVISED OR COMMENTED WELL"""
-    # TODO: finish commenting
-
-    if alt:
-        groupby_list = ["cs", "Tname_B"]
-    else:
-        groupby_list = ["cs"]
-    df2 = df2.set_index(groupby_list)
-    df2_groupby = df2.groupby(level=groupby_list)
-
-    # group and concatenate read ids
-    df2["all_but_last"] = df2_groupby["read_id"].apply("|".join)
-    df2["last_read_id"] = df2_groupby["next_read_id"].last()
-
-    # TODO: this is the failing point, can it be cut off sooner?
-
-    df2["cat_read_id"] = df2["all_but_last"] + "|" + df2["last_read_id"]
-
-    # group and combine length
-    df2["combined_length"] = df2_groupby["sequence_length_template"].sum()
-    df2["last_length"] = df2_groupby["next_sequence_length_template"].last()
-    df2["combined_length"] = df2["combined_length"] + df2["last_length"]
-
-    # take max/min for end/start match from grouped value list
-    df2["start_match"] = (
-        df2_groupby[["Tstart_A", "Tstart_B", "Tend_A", "Tend_B"]]
-        .transform("min")
-        .min(axis=1)
-    )
-    df2["end_match"] = (
-        df2_groupby[["Tstart_A", "Tstart_B", "Tend_A", "Tend_B"]]
-        .transform("max")
-        .max(axis=1)
-    )
-
-    # group and add start and end times
-    df2["start_time"] = df2_groupby["start_time"].first()
-    df2["next_end"] = df2_groupby["next_end"].last()
-
-    # add the duration (time between start and end)
-    df2["duration"] = df2["next_end"] - df2["start_time"]
-
-    # format and add coordinates
-    df2["stime_floor"] = np.floor(df2["start_time"]).astype("int64").astype("str")
-    df2["etime_ceil"] = np.ceil(df2["next_end"]).astype("int64").astype("str")
-    df2["channel"] = df2["channel"].astype("int64").astype("str")
-    df2["combined_length"] = df2["combined_length"].astype("int64")
-    df2["start_match"] = df2["start_match"].astype("int64").astype("str")
-    df2["end_match"] = df2["end_match"].astype("int64").astype("str")
-    df2["duration"] = df2["duration"].map("{:.5f}".format)
-    df2["coords"] = df2["channel"] + ":" + df2["stime_floor"] + "-" + df2["etime_ceil"]
-
-    # rename cols for export
-    df2.rename(columns={"Tname_A": "target_name", "Strand_A": "strand"}, inplace=True)
-
-    # fused_read_ids is a pd.Series of all fused reads
-    fused_read_ids = pd.concat([df2["read_id"], df2["next_read_id"]])
-
-    df2["count"] = df2_groupby.size() + 1
-
-    # remove duplicate entries from df2
-    df2 = df2.drop_duplicates(
-        subset=[
-            "coords",
-            "channel",
-            "start_time",
-            "duration",
-            "combined_length",
-            "start_match",
-            "end_match",
-            "cat_read_id",
-        ],
-        keep="first",
+    # fused_read_ids are all reads that are part of a chain
+    fused_read_ids = pd.unique(
+        np.concatenate([df2["read_id"].to_numpy(), df2["next_read_id"].to_numpy()])
     )
-    fused_read_ids = fused_read_ids.unique()
+    df2 = _assemble_chains(df2.reset_index(drop=True), alt)
 
     # un_fused_df contains reads that are correctly split
     un_fused_df = seq_sum_df[~seq_sum_df["read_id"].isin(fused_read_ids)].reset_index()
@@ -1,8 +1,11 @@
 from bulkvis.core import (
-    concat_files_to_df,
+    InputFileError,
+    die,
     fuse_reads,
     length_stats,
     human_readable_yield,
+    read_pafs,
+    read_summaries,
     top_n,
 )
 from collections import OrderedDict
@@ -34,6 +37,16 @@ _cli = (
             metavar="",
         ),
     ),
+    (
+        "--threads",
+        dict(
+            help="Number of processes reading input files and joining reads to their mappings, "
+            "the output does not depend on it (default: 1)",
+            type=int,
+            default=1,
+            metavar="",
+        ),
+    ),
     # The behaviour of 'alt' is confusing... it seems like a double negative
     (
         "-a",
@@ -76,13 +89,12 @@ _cli = (
 )
 
 
-def run(parser, args):
-    """Input and output controller for bulkvis fuse"""
+def _load_inputs(args):
+    """Return the sequencing summary and paf DataFrames named on the command line"""
     # Open sequencing_summary_*.txt files into a single pd.DataFrame
-    seq_sum_df = concat_files_to_df(
-        file_list=args.summary,
-        sep="\t",
-        usecols=[
+    seq_sum_df = read_summaries(
+        args.summary,
+        [
             "channel",
             "start_time",
             "duration",
@@ -90,18 +102,21 @@ def run(parser, args):
             "read_id",
             "sequence_length_template",
         ],
+        threads=args.threads,
     )
     # Open minimap2 paf files into a single pd.DataFrame
-    paf_df = concat_files_to_df(
-        file_list=args.paf,
-        sep="\t",
-        header=None,
-        usecols=[0, 4, 5, 7, 8],
-        names=["Qname", "Strand", "Tname", "Tstart", "Tend"],
-        engine="python",
-    )
+    paf_df = read_pafs(args.paf, threads=args.threads)
+    return seq_sum_df, paf_df
+
+
+def run(parser, args):
+    """Input and output controller for bulkvis fuse"""
+    try:
+        seq_sum_df, paf_df = _load_inputs(args)
+    except InputFileError as e:
+        die(str(e))
     fused_df, un_fused_df, to_be_fused_df = fuse_reads(
-        seq_sum_df, paf_df, distance=args.distance, alt=args.alt
+        seq_sum_df, paf_df, distance=args.distance, alt=args.alt, threads=args.threads
     )
     # Get yield numbers
     original_bases = np.sum(seq_sum_df["sequence_length_template"])
@@ -0,0 +1,159 @@
+"""handles.py
+
+Reference counted pool of read-only h5py.File handles shared by every viewer
+session in a server process, so sessions viewing the same bulk file share its
+HDF5 metadata and chunk caches
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+import h5py
+
+LOGGER = logging.getLogger(__name__)
+
+
+class HandlePool:
+    """Read-only file handles keyed by path, closed once unused for idle_seconds
+    Parameters
+    ----------
+    idle_seconds : float
+        How long a handle with no users is kept open for the next session
+    """
+
+    def __init__(self, idle_seconds):
+        self.idle_seconds = float(idle_seconds)
+        self.opened = 0
+        self.reused = 0
+        self._handles = {}  # key: [handle, users, released at, (size, mtime)]
+        self._opening = {}  # key: threading.Event set once its opener returns
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, key):
+        return str(key) in self._handles
+
+    def acquire(self, path, opener=None):
+        """Return an open handle for path, opening it if no session has it open
+
+        Handles nobody is using are reopened if the file has changed on disk.
+        Files are opened outside the pool lock, so a slow open only holds up
+        other requests for the same path, which wait for it.
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            File to open, also the key of the handle
+        opener : callable or None
+            Called with path to open the file, defaults to opening it read-only
+            with h5py. If it returns None, None is returned and nothing is pooled
+        Returns
+        -------
+        h5py.File or None
+        """
+        key = str(path)
+        try:
+            st = os.stat(key)
+            version = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            version = None
+        while True:
+            with self._lock:
+                self._evict_idle()
+                entry = self._handles.get(key)
+                if entry is not None and entry[1] == 0 and entry[3] != version:
+                    self._close(key)
+                    entry = None
+                if entry is not None:
+                    self.reused += 1
+                    entry[1] += 1
+                    return entry[0]
+                opening = self._opening.get(key)
+                if opening is None:
+                    opening = self._opening[key] = threading.Event()
+                    break
+            opening.wait()
+        try:
+            handle = opener(path) if opener is not None else h5py.File(key, "r")
+        finally:
+            with self._lock:
+                del self._opening[key]
+            opening.set()
+        if handle is None:
+            return None
+        with self._lock:
+            self._handles[key] = [handle, 1, None, version]
+            self.opened += 1
+        return handle
+
+    def release(self, handle):
+        """Give back a handle returned by acquire, it stays open while idle"""
+        if handle is None:
+            return
+        with self._lock:
+            for entry in self._handles.values():
+                if entry[0] is handle:
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        entry[2] = time.monotonic()
+                    break
+            self._evict_idle()
+
+    def evict_idle(self):
+        """Close handles that have had no users for idle_seconds"""
+        with self._lock:
+            self._evict_idle()
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        idle = [
+            key
+            for key, (_, users, released, _) in self._handles.items()
+            if users == 0 and now - released >= self.idle_seconds
+        ]
+        for key in idle:
+            self._close(key)
+
+    def _close(self, key):
+        handle = self._handles.pop(key)[0]
+        try:
+            handle.close()
+        except Exception as e:
+            LOGGER.debug(f"Closing {key} failed: {e}")
+
+    def stats(self):
+        """Return a dict of pool counters"""
+        with self._lock:
+            users = sum(entry[1] for entry in self._handles.values())
+        return {
+            "open": len(self._handles),
+            "users": users,
+            "opened": self.opened,
+            "reused": self.reused,
+        }
+
+    def __str__(self):
+        s = self.stats()
+        return "{o} open files, {u} users, {r} of {t} opens shared".format(
+            o=s["open"], u=s["users"], r=s["reused"], t=s["opened"] + s["reused"]
+        )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shared_pool(idle_seconds):
+    """Return the process-wide HandlePool, created with idle_seconds on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HandlePool(idle_seconds)
+        return _pool
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: handles is not directly executable")
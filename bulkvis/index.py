@@ -0,0 +1,307 @@
+"""index.py
+
+Build the sidecar file read by the viewer: decimated signal levels clipped to
+the cut-offs, per second signal statistics (see bulkvis.stats) and sorted
+copies of the annotation arrays for every channel in a bulk FAST5 file, plus a
+read_id index covering all channels.
+"""
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+import os
+from pathlib import Path
+
+import h5py
+import numpy as np
+from tqdm import tqdm
+
+from bulkvis.annotations import build_read_index_rows
+from bulkvis.bulkfile import read_signal, signal_length
+from bulkvis.catalogue import read_metadata
+from bulkvis.core import die
+from bulkvis.pyramid import (
+    MIN_BINS,
+    MIN_LEVEL,
+    clip_minmax_reduce,
+    coarsen_clipped,
+    sidecar_path,
+)
+from bulkvis.stats import chunk_stats
+
+# Seconds of signal reduced by each task, keeps worker memory bounded
+BLOCK_SECONDS = 1024
+# Tasks in flight per worker, bounds the results waiting to be written
+TASKS_PER_WORKER = 2
+SIDECAR_VERSION = 3
+
+_help = "Build a sidecar index of a bulk FAST5 file for faster viewing"
+_cli = (
+    (
+        "bulkfile",
+        dict(help="bulk FAST5 file to index", metavar="BULK_FILE"),
+    ),
+    (
+        "-t",
+        "--threads",
+        dict(
+            help="Number of worker processes, defaults to the number of CPUs",
+            type=int,
+            default=os.cpu_count(),
+            metavar="",
+        ),
+    ),
+    (
+        "-o",
+        "--output",
+        dict(
+            help="Sidecar file to write, defaults to the bulk file name with a .bvi "
+            "extension. The viewer only finds sidecars in the default location",
+            default=None,
+            metavar="",
+        ),
+    ),
+    (
+        "--cut-offs",
+        dict(
+            help="Lower and upper signal cut-offs of the decimated levels and signal "
+            "statistics, these should match lower_cut_off and upper_cut_off of the "
+            "viewer, which reads the raw signal for other cut-offs "
+            "(default: -4100 10000)",
+            nargs=2,
+            type=int,
+            default=[-4100, 10000],
+            metavar=("LOWER", "UPPER"),
+        ),
+    ),
+    (
+        "--force",
+        dict(
+            help="Rebuild the index from scratch instead of resuming",
+            action="store_true",
+        ),
+    ),
+)
+
+
+def block_levels(sf):
+    """Return the pyramid levels whose bins never straddle a task block"""
+    block = sf * BLOCK_SECONDS
+    top = MIN_LEVEL
+    while block % 2 ** (top + 1) == 0:
+        top += 1
+    return list(range(MIN_LEVEL, top + 1))
+
+
+def sorted_annotations(bulkfile, channel_str):
+    """Return {name: array} of a channel's Reads and States sorted by sample index"""
+    annotations = {}
+    for group, name, key in [
+        ("IntermediateData", "Reads", "read_start"),
+        ("StateData", "States", "acquisition_raw_index"),
+    ]:
+        try:
+            data = bulkfile[group][channel_str][name][()]
+        except KeyError:
+            continue
+        annotations[name] = data[np.argsort(data[key], kind="stable")]
+    return annotations
+
+
+_worker = {}
+
+
+def _init_worker(path, sf, cut_offs):
+    """Open the bulk file once in each worker process"""
+    _worker["bulkfile"] = h5py.File(path, "r")
+    _worker["sf"] = sf
+    _worker["cut_offs"] = cut_offs
+    _worker["levels"] = block_levels(sf)
+
+
+def _index_block(task):
+    """Reduce one block of a channel, returning the data to append to the sidecar"""
+    channel_str, block, n_blocks = task
+    bulkfile, sf = _worker["bulkfile"], _worker["sf"]
+    size = sf * BLOCK_SECONDS
+    _, signal = read_signal(bulkfile, channel_str, block * size, (block + 1) * size)
+    levels = {}
+    minmax = clip_minmax_reduce(signal, 2 ** MIN_LEVEL, *_worker["cut_offs"])
+    for level in _worker["levels"]:
+        if level > MIN_LEVEL:
+            minmax = coarsen_clipped(minmax)
+        levels[level] = minmax
+    annotations = sorted_annotations(bulkfile, channel_str) if block == 0 else None
+    return (
+        channel_str,
+        block,
+        n_blocks,
+        levels,
+        chunk_stats(signal, sf, *_worker["cut_offs"]),
+        annotations,
+    )
+
+
+def _replace(group, name, **kwargs):
+    """Create a dataset in group, removing any partial copy from an interrupted run"""
+    if name in group:
+        del group[name]
+    if "data" in kwargs and len(kwargs["data"]) == 0:
+        # empty datasets cannot be chunked for compression
+        kwargs.pop("compression", None)
+    return group.create_dataset(name, **kwargs)
+
+
+def _append(ds, data):
+    """Append rows to a resizable dataset"""
+    n = ds.shape[0]
+    ds.resize(n + len(data), axis=0)
+    ds[n:] = data
+
+
+def _start_channel(sidecar, channel_str, levels, summary, annotations):
+    """Create (or reset) the sidecar datasets for a channel"""
+    pyramid = sidecar.require_group("Pyramid").require_group(channel_str)
+    pyramid.attrs["complete"] = False
+    pyramid.attrs["cut_offs"] = sidecar.attrs["cut_offs"]
+    for level in list(pyramid):
+        del pyramid[level]
+    for level, minmax in levels.items():
+        ds = _replace(
+            pyramid,
+            str(level),
+            shape=(0, 2),
+            maxshape=(None, 2),
+            dtype=minmax.dtype,
+            chunks=(4096, 2),
+            compression="gzip",
+            compression_opts=1,
+        )
+        ds.attrs["factor"] = 2 ** level
+    ds = _replace(
+        sidecar.require_group("Summary"),
+        channel_str,
+        shape=(0,),
+        maxshape=(None,),
+        dtype=summary.dtype,
+        chunks=(4096,),
+        compression="gzip",
+        compression_opts=1,
+    )
+    ds.attrs["samples"] = sidecar.attrs["sample_frequency"]
+    ds.attrs["cut_offs"] = sidecar.attrs["cut_offs"]
+    annotation_group = sidecar.require_group("Annotations").require_group(channel_str)
+    for name, data in annotations.items():
+        _replace(annotation_group, name, data=data, compression="gzip")
+
+
+def _finish_channel(sidecar, channel_str, levels):
+    """Add the levels coarser than a block and mark the channel complete"""
+    pyramid = sidecar["Pyramid"][channel_str]
+    level = max(levels)
+    minmax = pyramid[str(level)][()]
+    while len(minmax) > MIN_BINS:
+        minmax = coarsen_clipped(minmax)
+        level += 1
+        ds = _replace(pyramid, str(level), data=minmax, maxshape=(None, 2))
+        ds.attrs["factor"] = 2 ** level
+    pyramid.attrs["complete"] = True
+    sidecar.flush()
+
+
+def _bounded_imap(pool, func, tasks, window):
+    """Yield func(task) for each task in order, keeping at most window in flight
+
+    Unlike Pool.imap, tasks are only submitted as earlier results are consumed
+    so results queued behind a slow consumer cannot grow without limit.
+    """
+    tasks = iter(tasks)
+    pending = deque(pool.apply_async(func, (t,)) for t in islice(tasks, window))
+    while pending:
+        result = pending.popleft().get()
+        for task in islice(tasks, 1):
+            pending.append(pool.apply_async(func, (task,)))
+        yield result
+
+
+def run(parser, args):
+    """Index each channel of a bulk FAST5 file in a process pool"""
+    bulk_path = Path(args.bulkfile).expanduser()
+    output = Path(args.output) if args.output else sidecar_path(bulk_path)
+    try:
+        with h5py.File(bulk_path, "r") as bulkfile:
+            metadata = read_metadata(bulkfile)
+            channels = list(bulkfile["Raw"]) if metadata["valid"] else []
+            lengths = {ch: signal_length(bulkfile, ch) for ch in channels}
+    except OSError as e:
+        die(f"Could not open {bulk_path}: {e}")
+    if not metadata["valid"] or metadata["sample_frequency"] is None:
+        die(f"{bulk_path} is not a bulk FAST5 file")
+    sf = metadata["sample_frequency"]
+    cut_offs = tuple(args.cut_offs)
+    stat = bulk_path.stat()
+
+    mode = "a"
+    if args.force or not output.is_file():
+        mode = "w"
+    else:
+        try:
+            with h5py.File(output, "r") as existing:
+                if (
+                    existing.attrs.get("source_size") != stat.st_size
+                    or existing.attrs.get("source_mtime") != stat.st_mtime_ns
+                    or existing.attrs.get("version") != SIDECAR_VERSION
+                    or tuple(existing.attrs.get("cut_offs", ())) != cut_offs
+                ):
+                    mode = "w"
+        except OSError:
+            # Truncated or corrupt by an interrupted run, start again
+            print(f"Could not read {output}, rebuilding it")
+            mode = "w"
+
+    with h5py.File(output, mode) as sidecar:
+        sidecar.attrs["source_size"] = stat.st_size
+        sidecar.attrs["source_mtime"] = stat.st_mtime_ns
+        sidecar.attrs["sample_frequency"] = sf
+        sidecar.attrs["version"] = SIDECAR_VERSION
+        sidecar.attrs["cut_offs"] = cut_offs
+        done = {
+            ch
+            for ch, group in sidecar.get("Pyramid", {}).items()
+            if group.attrs.get("complete", False)
+        }
+        todo = [ch for ch in channels if ch not in done]
+        if done:
+            print(f"Resuming: {len(done)} of {len(channels)} channels already indexed")
+        size = sf * BLOCK_SECONDS
+        tasks = []
+        for ch in todo:
+            n_blocks = max(-(-lengths[ch] // size), 1)
+            tasks.extend((ch, block, n_blocks) for block in range(n_blocks))
+
+        threads = max(args.threads, 1)
+        with Pool(
+            processes=threads,
+            initializer=_init_worker,
+            initargs=(str(bulk_path), sf, cut_offs),
+        ) as pool:
+            results = _bounded_imap(
+                pool, _index_block, tasks, threads * TASKS_PER_WORKER
+            )
+            for channel_str, block, n_blocks, levels, summary, annotations in tqdm(
+                results, total=len(tasks), desc="Blocks indexed"
+            ):
+                if block == 0:
+                    _start_channel(sidecar, channel_str, levels, summary, annotations)
+                pyramid = sidecar["Pyramid"][channel_str]
+                for level, minmax in levels.items():
+                    _append(pyramid[str(level)], minmax)
+                _append(sidecar["Summary"][channel_str], summary)
+                if block == n_blocks - 1:
+                    _finish_channel(sidecar, channel_str, levels)
+
+        if todo or "ReadIndex" not in sidecar:
+            with h5py.File(bulk_path, "r") as bulkfile:
+                rows = build_read_index_rows(bulkfile, sidecar)
+            _replace(sidecar, "ReadIndex", data=rows, compression="gzip")
+
+    print(f"Indexed {len(todo)} channels, sidecar saved as {output}")
@@ -3,6 +3,8 @@ import numpy as np
 from readpaf import parse_paf
 import gzip
 
+from bulkvis.core import InputFileError, die, read_summaries
+
 # from argparse import ArgumentParser
 from pathlib import Path
 
@@ -37,9 +39,22 @@ def run(parser, args):
     #     usecols=[0, 4, 5, 7, 8, 11, 12],
     # )
     pf = pf.drop_duplicates(["query_name"], keep="first")
+    # Tags are not at fixed columns, so the PAF is parsed by readpaf and given
+    # the compact dtypes afterwards
+    pf = pf.astype(
+        {
+            "strand": "category",
+            "target_name": "category",
+            "target_start": "int32",
+            "target_end": "int32",
+        }
+    )
     # Open sequencing_summary.txt file
     cols = ["read_id", "run_id", "channel", "start_time", "duration"]
-    ss = pd.read_csv(args.summary, sep="\t", usecols=cols)
+    try:
+        ss = read_summaries([args.summary], cols)
+    except InputFileError as e:
+        die(str(e))
     # Merge seq_sum and paf files
     df = pd.merge(ss, pf, left_on="read_id", right_on="query_name", how="outer")
     df = df.dropna()
@@ -80,7 +95,7 @@ def run(parser, args):
         "label",
     ]
     i = 0
-    for k, v in df.groupby(["run_id"]):
+    for k, v in df.groupby(["run_id"], observed=True):
         # Join 'bmf' path, run_id, and file extension
         p = Path(args.bmf).joinpath(str(k) + ".bmf")
         v.to_csv(p, sep="\t", header=True, columns=header, index=False)
@@ -1,6 +1,6 @@
 """merge.py
 """
-from bulkvis.core import die, fuse_reads, concat_files_to_df, find_files_of_type
+from bulkvis.core import die, fuse_reads, find_files_of_type, InputFileError, read_pafs, read_summaries
 import pandas as pd
 from pathlib import Path
 from tqdm import tqdm
@@ -100,19 +100,15 @@ def run(parser, args):
         fused_read_ids = [item for sublist in fused_read_tuples for item in sublist]
     elif args.summary and args.paf and not args.fused_reads:
         # Open sequencing_summary file and paf file, and run bulkvis.fuse_reads
-        seq_sum_df = concat_files_to_df(file_list=args.summary,
-                                        sep='\t',
-                                        usecols=['channel', 'start_time', 'duration',
-                                                 'run_id', 'read_id', 'sequence_length_template',
-                                                 'filename']
+        try:
+            seq_sum_df = read_summaries(args.summary,
+                                        ['channel', 'start_time', 'duration', 'run_id',
+                                         'read_id', 'sequence_length_template', 'filename']
                                         )
-        # Open minimap2 paf files into a single pd.DataFrame
-        paf_df = concat_files_to_df(file_list=args.paf,
-                                    sep='\t',
-                                    header=None,
-                                    usecols=[0, 4, 5, 7, 8],
-                                    names=['Qname', 'Strand', 'Tname', 'Tstart', 'Tend']
-                                    )
+            # Open minimap2 paf files into a single pd.DataFrame
+            paf_df = read_pafs(args.paf)
+        except InputFileError as e:
+            die(str(e))
         fused_df, un_fused_df, to_be_fused_df = fuse_reads(seq_sum_df, paf_df, distance=args.distance, alt=False)
         fused_read_tuples = fused_df['cat_read_id'].str.split('|').tolist()
         fused_read_ids = to_be_fused_df['read_id'].tolist()
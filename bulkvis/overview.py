@@ -0,0 +1,198 @@
+"""overview.py
+
+Whole flowcell activity: the fraction of each time bin every channel spends in
+each summary_state, computed from StateData without reading any signal
+"""
+from collections import OrderedDict
+import os
+import sys
+import threading
+
+import h5py
+import numpy as np
+
+from bulkvis.bulkfile import channel_name
+from bulkvis.stack import worker_files
+
+CACHE_ENTRIES = 8
+GROUPS_PER_WORKER = 4
+
+
+class FlowcellActivity:
+    """State fractions of every channel in fixed time bins
+    Parameters
+    ----------
+    channels : numpy.ndarray
+        Channel numbers, one per row of fractions, ascending
+    edges : numpy.ndarray
+        Sample indexes of the n_bins + 1 bin edges
+    labels : dict
+        summary_state name to code, one per plane of fractions
+    fractions : numpy.ndarray
+        float32 array of shape (len(labels), len(channels), n_bins), NaN for
+        channels without StateData
+    """
+
+    def __init__(self, channels, edges, labels, fractions):
+        self.channels = channels
+        self.edges = edges
+        self.labels = labels
+        self.fractions = fractions
+
+    def __len__(self):
+        return len(self.channels)
+
+    def fraction(self, label):
+        """Return the (channels, bins) fractions of time spent in the named state"""
+        return self.fractions[list(self.labels).index(label)]
+
+    def grid(self, label):
+        """Return fraction(label) with a row for every channel from the first to the last
+
+        Rows of channels not in the file are NaN, so row i is channel
+        channels[0] + i.
+        """
+        first, last = int(self.channels[0]), int(self.channels[-1])
+        grid = np.full((last - first + 1, len(self.edges) - 1), np.nan, np.float32)
+        grid[self.channels - first] = self.fraction(label)
+        return grid
+
+    def cell(self, channel, sample):
+        """Return (start, end) samples of the bin holding sample, or None if outside"""
+        if channel not in self.channels:
+            return None
+        i = np.searchsorted(self.edges, sample, side="right") - 1
+        if i < 0 or i >= len(self.edges) - 1:
+            return None
+        return int(self.edges[i]), int(self.edges[i + 1])
+
+
+def state_fractions(raw_index, states, codes, edges):
+    """Return the fraction of each bin spent in each state
+    The state of a channel holds from its raw index to the next change, the
+    last state holds to the last edge. Time before the first change counts
+    toward no state.
+    Parameters
+    ----------
+    raw_index : numpy.ndarray
+        Sample index of each state change, ascending
+    states : numpy.ndarray
+        summary_state code of each change
+    codes : list
+        State codes to measure
+    edges : numpy.ndarray
+        Ascending sample indexes of the bin edges
+    Returns
+    -------
+    numpy.ndarray
+        float32 array of shape (len(codes), len(edges) - 1)
+    """
+    edges = np.asarray(edges, dtype=np.int64)
+    width = np.diff(edges).astype(np.float64)
+    if len(raw_index) == 0:
+        return np.zeros((len(codes), len(width)), dtype=np.float32)
+    starts = np.asarray(raw_index, dtype=np.int64)
+    inside = np.asarray(states)[None, :] == np.asarray(codes)[:, None]
+    # Time in each state up to the start of each segment, then up to each edge
+    segment = np.diff(starts, append=max(starts[-1], edges[-1]))
+    before = np.zeros(inside.shape, dtype=np.int64)
+    np.cumsum(inside[:, :-1] * segment[:-1], axis=1, out=before[:, 1:])
+    k = np.searchsorted(starts, edges, side="right") - 1
+    kk = np.maximum(k, 0)
+    upto = before[:, kk] + inside[:, kk] * (edges - starts[kk])
+    upto[:, k < 0] = 0
+    return (np.diff(upto, axis=1) / width).astype(np.float32)
+
+
+def channel_group_fractions(path, channels, codes, edges):
+    """Return state_fractions for each of a group of channels, run in the stack workers"""
+    bulkfile, _ = worker_files(path)
+    out = np.full((len(codes), len(channels), len(edges) - 1), np.nan, np.float32)
+    for i, channel in enumerate(channels):
+        name = "StateData/{ch}/States".format(ch=channel_name(channel))
+        if name not in bulkfile:
+            continue
+        data = bulkfile[name][()]
+        raw_index = data["acquisition_raw_index"]
+        order = np.argsort(raw_index, kind="stable")
+        out[:, i] = state_fractions(
+            raw_index[order], data["summary_state"][order], codes, edges
+        )
+    return out
+
+
+def state_labels(bulkfile):
+    """Return the summary_state name to code mapping of a bulk file, ordered by code
+
+    Empty if the file has no StateData.
+    """
+    for group in bulkfile.get("StateData", {}).values():
+        states = group.get("States")
+        if states is not None:
+            labels = h5py.check_enum_dtype(states.dtype["summary_state"]) or {}
+            return OrderedDict(sorted(labels.items(), key=lambda kv: kv[1]))
+    return OrderedDict()
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def flowcell_activity(path, bulkfile, n_samples, n_bins, reader):
+    """Return the FlowcellActivity of a bulk file, computed once per file version
+    Channels are split into groups computed in parallel by the reader's
+    worker processes. Results are cached in the server process, keyed on the
+    path, size and modification time of the file.
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        Bulk FAST5 file
+    bulkfile : h5py.File
+        The same file, open, used to list its channels and states
+    n_samples : int
+        Length of the run in samples, the bins span [0, n_samples)
+    n_bins : int
+        Number of time bins
+    reader : bulkvis.stack.StackReader
+        Worker pool computing the channel groups
+    Returns
+    -------
+    FlowcellActivity
+        With no labels, and so no fractions, if the file has no StateData
+    """
+    path = str(path)
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns, int(n_samples), int(n_bins))
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    labels = state_labels(bulkfile)
+    codes = list(labels.values())
+    channels = np.array(
+        sorted(int(name.split("_")[-1]) for name in bulkfile["Raw"]), dtype=np.int64
+    )
+    edges = np.unique(np.linspace(0, n_samples, int(n_bins) + 1).astype(np.int64))
+    n_groups = min(reader.workers * GROUPS_PER_WORKER, len(channels))
+    groups = np.array_split(channels, max(n_groups, 1))
+    futures = [
+        reader.submit(channel_group_fractions, path, group.tolist(), codes, edges)
+        for group in groups
+        if len(group) and codes
+    ]
+    if futures:
+        fractions = np.concatenate([f.result() for f in futures], axis=1)
+    else:
+        fractions = np.empty((len(codes), 0, len(edges) - 1), dtype=np.float32)
+    activity = FlowcellActivity(channels, edges, labels, fractions)
+
+    with _cache_lock:
+        _cache[key] = activity
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return activity
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: overview is not directly executable")
@@ -0,0 +1,405 @@
+"""pyramid.py
+
+Multi-resolution min/max envelopes of the raw signal. Level k holds the
+minimum and maximum of each bin of 2**k samples; levels are computed on the
+fly from the raw signal or read from a sidecar file next to the bulk file.
+"""
+import math
+from pathlib import Path
+import sys
+
+import h5py
+import numpy as np
+
+from bulkvis.bulkfile import read_signal
+
+# The finest stored level, bins of 16 samples
+MIN_LEVEL = 4
+# Levels are built until a channel has no more than this many bins
+MIN_BINS = 1024
+SIDECAR_SUFFIX = ".bvi"
+# Samples per block processed by the clip kernels, bounds their scratch memory
+CLIP_BLOCK = 2 ** 16
+# Marks clipped samples and empty bins in int16 output of the clip kernels
+SIGNAL_GAP = np.iinfo(np.int16).min
+
+
+def minmax_reduce(signal, factor):
+    """Return the minimum and maximum of each bin of `factor` samples
+    Parameters
+    ----------
+    signal : numpy.ndarray
+        1D array of samples, the final bin may be partial
+    factor : int
+        Number of samples in each bin
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (n_bins, 2) holding [min, max] for each bin
+    """
+    n_full = len(signal) // factor
+    n_bins = -(-len(signal) // factor)
+    out = np.empty((n_bins, 2), dtype=signal.dtype)
+    if n_full:
+        full = signal[: n_full * factor].reshape(n_full, factor)
+        full.min(axis=1, out=out[:n_full, 0])
+        full.max(axis=1, out=out[:n_full, 1])
+    if n_bins > n_full:
+        tail = signal[n_full * factor :]
+        out[-1] = tail.min(), tail.max()
+    return out
+
+
+def _clip_output(dtype, n):
+    """Return an empty output array for the clip kernels and the gap value it uses"""
+    if dtype == np.int16:
+        return np.empty(n, dtype=np.int16), SIGNAL_GAP
+    return np.empty(n, dtype=np.float32), np.nan
+
+
+def clip_signal(signal, lower, upper):
+    """Return the signal with samples outside [lower, upper] replaced by a gap
+    The signal is scanned once in blocks of CLIP_BLOCK samples, so the only
+    array the size of the signal is the output.
+    Parameters
+    ----------
+    signal : numpy.ndarray
+        1D array of samples
+    lower, upper : int or float
+        Samples outside this range become gaps
+    Returns
+    -------
+    numpy.ndarray
+        int16 with SIGNAL_GAP gaps for int16 signal, otherwise float32 with NaN gaps
+    """
+    out, gap = _clip_output(signal.dtype, len(signal))
+    scratch = np.empty(min(len(signal), CLIP_BLOCK), dtype=bool)
+    outside = np.empty_like(scratch)
+    for i in range(0, len(signal), CLIP_BLOCK):
+        block = signal[i : i + CLIP_BLOCK]
+        o = out[i : i + CLIP_BLOCK]
+        n = len(block)
+        np.less(block, lower, out=outside[:n])
+        np.greater(block, upper, out=scratch[:n])
+        np.logical_or(outside[:n], scratch[:n], out=outside[:n])
+        np.copyto(o, block, casting="unsafe")
+        np.copyto(o, gap, where=outside[:n], casting="unsafe")
+    return out
+
+
+def clip_minmax_reduce(signal, factor, lower, upper):
+    """Return the min and max of the in-range samples in each bin of `factor` samples
+    Clipping and decimation are done in a single pass over blocks of about
+    CLIP_BLOCK samples, so scratch memory does not grow with the signal. Samples
+    outside [lower, upper] are ignored and bins with no samples in range are gaps.
+    Parameters
+    ----------
+    signal : numpy.ndarray
+        1D array of samples, the final bin may be partial
+    factor : int
+        Number of samples in each bin
+    lower, upper : int or float
+        Samples outside this range are ignored
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (n_bins, 2) holding [min, max] for each bin, int16 with
+        SIGNAL_GAP gaps for int16 signal, otherwise float32 with NaN gaps
+    """
+    if factor == 1:
+        return np.repeat(clip_signal(signal, lower, upper), 2).reshape(-1, 2)
+    n_bins = -(-len(signal) // factor)
+    out, gap = _clip_output(signal.dtype, n_bins * 2)
+    out = out.reshape(n_bins, 2)
+    if np.issubdtype(signal.dtype, np.integer):
+        info = np.iinfo(signal.dtype)
+        lowest, highest = info.min, info.max
+    else:
+        lowest, highest = -np.inf, np.inf
+    bins_per_block = max(CLIP_BLOCK // factor, 1)
+    step = bins_per_block * factor
+    inside = np.empty(min(len(signal), step), dtype=bool)
+    outside = np.empty_like(inside)
+    # block copies with ignored samples replaced so they never win min or max
+    for_min = np.empty(len(inside), dtype=signal.dtype)
+    for_max = np.empty_like(for_min)
+    for i in range(0, len(signal), step):
+        block = signal[i : i + step]
+        n = len(block)
+        np.less(block, lower, out=outside[:n])
+        np.greater(block, upper, out=inside[:n])
+        np.logical_or(outside[:n], inside[:n], out=outside[:n])
+        np.logical_not(outside[:n], out=inside[:n])
+        if outside[:n].any():
+            np.copyto(for_min[:n], block)
+            np.copyto(for_min[:n], highest, where=outside[:n], casting="unsafe")
+            np.copyto(for_max[:n], block)
+            np.copyto(for_max[:n], lowest, where=outside[:n], casting="unsafe")
+            lo_values, hi_values = for_min[:n], for_max[:n]
+        else:
+            lo_values = hi_values = block
+        first = i // factor
+        n_full = n // factor
+        # full bins, then the partial bin at the end of the signal
+        for lo, hi, shape in [
+            (0, n_full * factor, (n_full, factor)),
+            (n_full * factor, n, (1, n - n_full * factor)),
+        ]:
+            if hi <= lo:
+                continue
+            o = out[first + lo // factor : first + lo // factor + shape[0]]
+            lo_values[lo:hi].reshape(shape).min(axis=1, out=o[:, 0])
+            hi_values[lo:hi].reshape(shape).max(axis=1, out=o[:, 1])
+            if outside[lo:hi].any():
+                o[~inside[lo:hi].reshape(shape).any(axis=1)] = gap
+    return out
+
+
+def signal_limits(signal):
+    """Return the (min, max) of the output of a clip kernel ignoring gaps, or None"""
+    if signal.dtype == np.int16:
+        valid = signal != SIGNAL_GAP
+        if not valid.any():
+            return None
+        info = np.iinfo(np.int16)
+        return (
+            signal.min(where=valid, initial=info.max),
+            signal.max(where=valid, initial=info.min),
+        )
+    if len(signal) == 0 or np.isnan(signal).all():
+        return None
+    return np.nanmin(signal), np.nanmax(signal)
+
+
+def coarsen(minmax, factor=2):
+    """Return a min/max envelope reduced by `factor` bins per bin, see minmax_reduce"""
+    n_full = len(minmax) // factor
+    n_bins = -(-len(minmax) // factor)
+    out = np.empty((n_bins, 2), dtype=minmax.dtype)
+    if n_full:
+        full = minmax[: n_full * factor].reshape(n_full, factor, 2)
+        full[:, :, 0].min(axis=1, out=out[:n_full, 0])
+        full[:, :, 1].max(axis=1, out=out[:n_full, 1])
+    if n_bins > n_full:
+        tail = minmax[n_full * factor :]
+        out[-1] = tail[:, 0].min(), tail[:, 1].max()
+    return out
+
+
+def coarsen_clipped(minmax, factor=2):
+    """Return coarsen(minmax, factor) for the output of clip_minmax_reduce
+    Gap bins are ignored, a bin is only a gap if all the bins it covers are.
+    """
+    if minmax.dtype == np.int16:
+        lo = np.where(minmax[:, 0] == SIGNAL_GAP, np.iinfo(np.int16).max, minmax[:, 0])
+        out = coarsen(np.stack((lo, minmax[:, 1]), axis=1), factor)
+        out[out[:, 1] == SIGNAL_GAP] = SIGNAL_GAP
+        return out
+    gaps = np.isnan(minmax)
+    out = coarsen(
+        np.stack(
+            (
+                np.where(gaps[:, 0], np.inf, minmax[:, 0]),
+                np.where(gaps[:, 1], -np.inf, minmax[:, 1]),
+            ),
+            axis=1,
+        ).astype(minmax.dtype),
+        factor,
+    )
+    out[np.isneginf(out[:, 1])] = np.nan
+    return out
+
+
+def build_pyramid(signal, min_level=MIN_LEVEL, min_bins=MIN_BINS):
+    """Return {level: min/max envelope} for a channel's signal
+    Each level is reduced from the one below, so the signal is only scanned once.
+    """
+    levels = {min_level: minmax_reduce(signal, 2 ** min_level)}
+    level = min_level
+    while len(levels[level]) > min_bins:
+        levels[level + 1] = coarsen(levels[level])
+        level += 1
+    return levels
+
+
+def choose_level(n_samples, n_pixels):
+    """Return the pyramid level giving roughly one bin per pixel, or 0 if raw samples fit"""
+    if n_pixels <= 0 or n_samples <= n_pixels * 2 ** MIN_LEVEL:
+        return 0
+    return max(MIN_LEVEL, int(math.floor(math.log2(n_samples / n_pixels))))
+
+
+def budget_level(n_samples, max_points):
+    """Return the finest level whose envelope has at most max_points points, 0 for raw
+
+    Each bin of an envelope is drawn with two points, its minimum and maximum.
+    """
+    if max_points <= 0 or n_samples <= max_points:
+        return 0
+    return max(MIN_LEVEL, int(math.ceil(math.log2(2 * n_samples / max_points))))
+
+
+def sidecar_path(bulk_path):
+    """Return the path of the sidecar file for a bulk FAST5 file"""
+    return Path(bulk_path).with_suffix(SIDECAR_SUFFIX)
+
+
+def open_sidecar(bulk_path):
+    """Return the sidecar for a bulk FAST5 file opened read-only, or None
+
+    The sidecar is ignored if it is missing, unreadable, or was built from a
+    different version of the bulk file (size or mtime differ).
+    """
+    bulk_path = Path(bulk_path)
+    path = sidecar_path(bulk_path)
+    if not path.is_file():
+        return None
+    try:
+        sidecar = h5py.File(path, "r")
+    except OSError:
+        return None
+    stat = bulk_path.stat()
+    if (
+        sidecar.attrs.get("source_size") != stat.st_size
+        or sidecar.attrs.get("source_mtime") != stat.st_mtime_ns
+    ):
+        sidecar.close()
+        return None
+    return sidecar
+
+
+def write_pyramid(sidecar, channel_str, levels):
+    """Write {level: envelope} for a channel to an open, writable, sidecar file"""
+    group = sidecar.require_group("Pyramid").require_group(channel_str)
+    for level, minmax in levels.items():
+        if str(level) in group:
+            del group[str(level)]
+        ds = group.create_dataset(
+            str(level),
+            data=minmax,
+            maxshape=(None, 2),
+            chunks=True,
+            compression="gzip",
+            compression_opts=1,
+        )
+        ds.attrs["factor"] = 2 ** level
+    group.attrs["complete"] = True
+
+
+def stored_levels(sidecar, channel_str):
+    """Return the sorted pyramid levels available for a channel in a sidecar"""
+    if sidecar is None:
+        return []
+    try:
+        group = sidecar["Pyramid"][channel_str]
+    except KeyError:
+        return []
+    if not group.attrs.get("complete", False):
+        return []
+    return sorted(int(level) for level in group)
+
+
+def stored_clip(sidecar, channel_str):
+    """Return the (lower, upper) cut-offs a channel's stored levels were clipped to
+    None if the levels are not clipped, as in sidecars written before levels
+    were clipped, or the channel has no levels.
+    """
+    try:
+        cut_offs = sidecar["Pyramid"][channel_str].attrs.get("cut_offs")
+    except (KeyError, TypeError):
+        return None
+    return None if cut_offs is None else tuple(int(c) for c in cut_offs)
+
+
+def read_envelope(
+    bulkfile, channel_str, start, end, level, sidecar=None, cache=None, clip=None
+):
+    """Return the min/max envelope of a window at a pyramid level
+    Stored levels are read from the sidecar when available, coarser levels are
+    reduced from the coarsest stored level, otherwise only the window of raw
+    signal is read and reduced.
+    Parameters
+    ----------
+    bulkfile : h5py.File
+        An open bulk FAST5 file
+    channel_str : str
+        Channel group name, e.g. 'Channel_1'
+    start : int
+        Index of the first sample requested
+    end : int
+        Index one past the last sample requested
+    level : int
+        Pyramid level, bins are 2**level samples
+    sidecar : h5py.File or None
+        An open sidecar file, see open_sidecar
+    cache : bulkvis.cache.ChunkCache or None
+        Cache for raw signal chunks, see bulkvis.bulkfile.read_signal
+    clip : tuple or None
+        (lower, upper) limits of the signal. Samples outside them are ignored,
+        see clip_minmax_reduce. Stored levels are only used if they were
+        clipped to the same limits, see stored_clip
+    Returns
+    -------
+    first_bin : int
+        Index, at this level, of the first bin returned
+    minmax : numpy.ndarray
+        Array of shape (n_bins, 2) holding [min, max] for each bin
+    """
+    factor = 2 ** level
+    first_bin = max(int(start), 0) // factor
+    last_bin = -(-int(end) // factor)
+    levels = [l for l in stored_levels(sidecar, channel_str) if l <= level]
+    clipped = stored_clip(sidecar, channel_str) if levels else None
+    # Envelopes clipped to other limits cannot be clipped again: a bin with a
+    # single outlying sample has lost its min or max, so the raw signal is read
+    if levels and clipped == (None if clip is None else tuple(clip)):
+        stored = levels[-1]
+        step = 2 ** (level - stored)
+        ds = sidecar["Pyramid"][channel_str][str(stored)]
+        minmax = ds[first_bin * step : last_bin * step]
+        if step > 1 and clipped is None:
+            minmax = coarsen(minmax, step)
+        elif step > 1:
+            minmax = coarsen_clipped(minmax, step)
+        return first_bin, minmax
+    offset, signal = read_signal(
+        bulkfile, channel_str, first_bin * factor, last_bin * factor, cache=cache
+    )
+    if clip is not None:
+        return offset // factor, clip_minmax_reduce(signal, factor, *clip)
+    return offset // factor, minmax_reduce(signal, factor)
+
+
+def read_window(bulkfile, channel_str, start, end, level, clip, sidecar=None, cache=None):
+    """Return samples [start, end) of a channel clipped to (lower, upper) as evenly spaced points
+    Level 0 reads every sample, see clip_signal, higher levels read the min/max
+    envelope with bins of 2**level samples, see read_envelope. Each bin is
+    drawn as its minimum at the bin start and its maximum at the bin midpoint.
+    Returns
+    -------
+    first : int
+        Sample index of the first point
+    step : float
+        Samples between points
+    y : numpy.ndarray
+        int16 with SIGNAL_GAP gaps for int16 signal, otherwise float32 with NaN gaps
+    """
+    if level:
+        first_bin, minmax = read_envelope(
+            bulkfile,
+            channel_str,
+            start,
+            end,
+            level,
+            sidecar=sidecar,
+            cache=cache,
+            clip=clip,
+        )
+        factor = 2 ** level
+        return first_bin * factor, factor / 2, minmax.reshape(-1)
+    offset, signal = read_signal(bulkfile, channel_str, start, end, cache=cache)
+    return offset, 1, clip_signal(signal, *clip)
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: pyramid is not directly executable")
@@ -0,0 +1,109 @@
+"""readahead.py
+
+Read-ahead buffer of signal windows loaded in background threads, so that
+windows the viewer is likely to show next are ready before they are asked for
+"""
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+import logging
+import sys
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ReadAhead:
+    """Bounded buffer of windows loaded by a thread pool, evicting the oldest requests
+    Parameters
+    ----------
+    max_entries : int
+        Number of windows kept in the buffer, loaded or still loading
+    workers : int
+        Number of background threads loading windows
+    """
+
+    def __init__(self, max_entries, workers):
+        self.max_entries = int(max_entries)
+        self.requested = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(int(workers), 1), thread_name_prefix="bulkvis-readahead"
+        )
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def prefetch(self, key, fn, *args):
+        """Start loading fn(*args) in the background under key, unless it is buffered"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return
+            self._data[key] = self._executor.submit(fn, *args)
+            self.requested += 1
+            while len(self._data) > self.max_entries:
+                _, future = self._data.popitem(last=False)
+                future.cancel()
+
+    def get(self, key):
+        """Return the window loaded under key, waiting if it is still loading, or None
+
+        A window that failed to load counts as a miss, so the caller loads
+        it again and sees the error itself.
+        """
+        with self._lock:
+            future = self._data.get(key)
+            if future is not None:
+                self._data.move_to_end(key)
+        if future is not None:
+            try:
+                value = future.result()
+            except CancelledError:
+                value = None
+            except Exception as e:
+                LOGGER.debug(f"Read-ahead of {key} failed: {e}")
+                value = None
+            if value is not None:
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def clear(self):
+        """Drop all buffered windows, cancelling any not yet started"""
+        with self._lock:
+            for future in self._data.values():
+                future.cancel()
+            self._data.clear()
+
+    def shutdown(self):
+        """Drop all buffered windows and stop the background threads"""
+        self.clear()
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        """Return a dict of read-ahead counters"""
+        lookups = self.hits + self.misses
+        return {
+            "requested": self.requested,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._data),
+        }
+
+    def __str__(self):
+        s = self.stats()
+        return "{h} hits, {m} misses ({r:.1%}), {q} windows prefetched".format(
+            h=s["hits"], m=s["misses"], r=s["hit_rate"], q=s["requested"]
+        )
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: readahead is not directly executable")
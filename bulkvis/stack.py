@@ -0,0 +1,152 @@
+"""stack.py
+
+Read the same window from many channels of a bulk FAST5 file at once, in a
+pool of worker processes, for the viewer's stacked channel view
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import re
+import sys
+import threading
+
+from bulkvis.bulkfile import channel_name, open_bulk, signal_length
+from bulkvis.pyramid import choose_level, open_sidecar, read_window
+
+CHANNELS_RE = re.compile(r"^[0-9]{1,4}(-[0-9]{1,4})?(,[0-9]{1,4}(-[0-9]{1,4})?)*\Z")
+
+
+def parse_channels(spec):
+    """Return the channel numbers in a list of channels and ranges, e.g. '100-116,200'
+    Parameters
+    ----------
+    spec : str
+        Comma separated channel numbers or inclusive ranges 'first-last'
+    Returns
+    -------
+    list
+        Channel numbers in the order given, without repeats
+    Raises
+    ------
+    ValueError
+        If the spec is malformed or a range is reversed
+    """
+    if not CHANNELS_RE.match(spec):
+        raise ValueError(f"Invalid channel list: {spec}")
+    channels = []
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        first, last = int(first), int(last or first)
+        if last < first:
+            raise ValueError(f"Invalid channel range: {part}")
+        channels.extend(range(first, last + 1))
+    return list(dict.fromkeys(channels))
+
+
+_worker_files = {}
+
+
+def worker_files(path):
+    """Return (bulkfile, sidecar) for path, opened once per worker and file version
+
+    For use by functions run in the StackReader's worker processes.
+    """
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in _worker_files:
+        for old in [k for k in _worker_files if k[0] == path]:
+            for f in _worker_files.pop(old):
+                if f is not None:
+                    f.close()
+        _worker_files[key] = (open_bulk(path), open_sidecar(path))
+    return _worker_files[key]
+
+
+def _warm_up():
+    """Run in each new worker so its imports are done before the first read"""
+    return os.getpid()
+
+
+def read_channel(path, channel, start, end, n_pixels, clip):
+    """Read one channel's window in a worker, see StackReader.read"""
+    bulkfile, sidecar = worker_files(path)
+    channel_str = channel_name(channel)
+    if channel_str not in bulkfile["Raw"]:
+        return None
+    end = min(end, signal_length(bulkfile, channel_str))
+    level = choose_level(max(end - start, 0), n_pixels)
+    return read_window(bulkfile, channel_str, start, end, level, clip, sidecar=sidecar)
+
+
+class StackReader:
+    """Pool of worker processes that read a window from many channels concurrently
+    Worker processes are started with 'spawn' so they never inherit the open
+    HDF5 handles of the server, each keeps its own handles between requests.
+    They are started in the background when the reader is created.
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes
+    """
+
+    def __init__(self, workers):
+        self.workers = max(int(workers), 1)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        for _ in range(self.workers):
+            self._executor.submit(_warm_up)
+
+    def read(self, path, channels, start, end, n_pixels, clip):
+        """Return the window of each channel decimated to roughly n_pixels bins
+        Parameters
+        ----------
+        path : str
+            Bulk FAST5 file, its sidecar is used when it is current
+        channels : list
+            Channel numbers
+        start, end : int
+            Sample indexes of the window
+        n_pixels : int
+            Plot width, see bulkvis.pyramid.choose_level
+        clip : tuple
+            (lower, upper) limits of the signal, outside samples become gaps
+        Returns
+        -------
+        list
+            (first, step, y) for each channel as returned by
+            bulkvis.pyramid.read_window, None for channels not in the file
+        """
+        futures = [
+            self.submit(read_channel, str(path), ch, start, end, n_pixels, clip)
+            for ch in channels
+        ]
+        return [f.result() for f in futures]
+
+    def submit(self, fn, *args):
+        """Run fn(*args) in a worker process, fn must be a module level function
+        Returns
+        -------
+        concurrent.futures.Future
+        """
+        return self._executor.submit(fn, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def shared_reader(workers):
+    """Return the process-wide StackReader, created with `workers` processes on first use"""
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = StackReader(workers)
+        return _reader
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: stack is not directly executable")
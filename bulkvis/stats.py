@@ -0,0 +1,244 @@
+"""stats.py
+
+Fixed-length chunk statistics of the raw signal, written to the sidecar by
+`bulkvis index`, so that y-ranges, outliers and channel quality are known
+without decompressing any signal
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bulkvis.core import die
+from bulkvis.pyramid import clip_minmax_reduce, open_sidecar
+from bulkvis.stack import parse_channels
+
+_help = "Report the signal quality of each channel from a sidecar index"
+_cli = (
+    (
+        "bulkfile",
+        dict(help="bulk FAST5 file, indexed with 'bulkvis index'", metavar="BULK_FILE"),
+    ),
+    (
+        "-c",
+        "--channels",
+        dict(
+            help="Channels to report, as numbers and ranges, e.g. 1-128,200",
+            default=None,
+            metavar="",
+        ),
+    ),
+    (
+        "--min-std",
+        dict(
+            help="Seconds whose in-range signal has a lower standard deviation are "
+            "counted as dead (default: 2)",
+            type=float,
+            default=2,
+            metavar="",
+        ),
+    ),
+    (
+        "--max-outside",
+        dict(
+            help="Seconds with a larger fraction of samples outside the cut-offs are "
+            "counted as saturated (default: 0.01)",
+            type=float,
+            default=0.01,
+            metavar="",
+        ),
+    ),
+)
+
+
+def stats_dtype(signal_dtype):
+    """Return the dtype of chunk_stats rows for signal of the given dtype"""
+    minmax = np.int16 if np.dtype(signal_dtype) == np.int16 else np.float32
+    return np.dtype(
+        [
+            ("min", minmax),
+            ("max", minmax),
+            ("mean", "f4"),
+            ("std", "f4"),
+            ("count", "u4"),
+            ("outside", "u4"),
+        ]
+    )
+
+
+def chunk_stats(signal, chunk, lower, upper):
+    """Return the statistics of the in-range samples of each chunk of signal
+    Samples outside [lower, upper] are only counted, chunks with no samples in
+    range have gap min/max (see bulkvis.pyramid.clip_minmax_reduce) and NaN mean
+    and std.
+    Parameters
+    ----------
+    signal : numpy.ndarray
+        1D array of samples, the final chunk may be partial
+    chunk : int
+        Number of samples in each chunk
+    lower, upper : int or float
+        The signal cut-offs
+    Returns
+    -------
+    numpy.ndarray
+        Structured array with fields 'min', 'max', 'mean', 'std', 'count' (in
+        range) and 'outside', see stats_dtype
+    """
+    n_chunks = -(-len(signal) // chunk)
+    out = np.zeros(n_chunks, dtype=stats_dtype(signal.dtype))
+    if not n_chunks:
+        return out
+    minmax = clip_minmax_reduce(signal, chunk, lower, upper)
+    out["min"], out["max"] = minmax[:, 0], minmax[:, 1]
+    starts = np.arange(0, len(signal), chunk)
+    inside = (signal >= lower) & (signal <= upper)
+    values = np.where(inside, signal, 0).astype(np.float64)
+    count = np.add.reduceat(inside.astype(np.int64), starts)
+    total = np.add.reduceat(values, starts)
+    squares = np.add.reduceat(values * values, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        var = np.maximum(squares / count - mean * mean, 0)
+    out["mean"], out["std"] = mean, np.sqrt(var)
+    out["count"] = count
+    out["outside"] = np.diff(np.append(starts, len(signal))) - count
+    return out
+
+
+def channel_stats(sidecar, channel_str):
+    """Return the chunk statistics dataset of a channel, or None if it has none"""
+    ds = sidecar.get("Summary/{ch}".format(ch=channel_str))
+    if ds is None or "outside" not in (ds.dtype.names or ()):
+        return None
+    return ds
+
+
+def window_stats(sidecar, channel_str, start, end):
+    """Return the statistics of the chunks overlapping samples [start, end), or None"""
+    ds = channel_stats(sidecar, channel_str)
+    if ds is None:
+        return None
+    chunk = int(ds.attrs["samples"])
+    return ds[max(start, 0) // chunk : -(-end // chunk)]
+
+
+def window_limits(sidecar, channel_str, start, end, clip):
+    """Return the (min, max) of the in-range signal in samples [start, end)
+    Whole chunks are used, so the limits may include a little signal either
+    side of the window.
+    Parameters
+    ----------
+    sidecar : h5py.File
+        An open sidecar file
+    channel_str : str
+        Channel group name, e.g. 'Channel_1'
+    start, end : int
+        Sample indexes of the window
+    clip : tuple
+        (lower, upper) cut-offs of the viewer, limits are only returned if the
+        statistics were computed with the same cut-offs
+    Returns
+    -------
+    tuple or None
+        None if there are no matching statistics or no samples in range
+    """
+    ds = channel_stats(sidecar, channel_str)
+    if ds is None or tuple(ds.attrs.get("cut_offs", ())) != tuple(clip):
+        return None
+    rows = window_stats(sidecar, channel_str, start, end)
+    rows = rows[rows["count"] > 0]
+    if not len(rows):
+        return None
+    return rows["min"].min(), rows["max"].max()
+
+
+def channel_quality(sidecar, channels=None, min_std=2, max_outside=0.01):
+    """Return a table of the signal quality of each channel from its chunk statistics
+    Parameters
+    ----------
+    sidecar : h5py.File
+        An open sidecar file
+    channels : list or None
+        Channel numbers to include, defaults to all channels with statistics
+    min_std : float
+        Chunks whose in-range signal has a lower standard deviation are dead
+    max_outside : float
+        Chunks with a larger fraction of samples outside the cut-offs are saturated
+    Returns
+    -------
+    pandas.DataFrame
+        Indexed by channel, with the mean and std of the in-range signal, its
+        min and max, the fraction of samples outside the cut-offs, and the
+        fraction of chunks that are dead or saturated
+    """
+    if channels is None:
+        names = list(sidecar.get("Summary", {}))
+        channels = sorted(int(name.split("_")[-1]) for name in names)
+    table = []
+    for channel in channels:
+        ds = channel_stats(sidecar, "Channel_{ch}".format(ch=channel))
+        if ds is None:
+            continue
+        rows = ds[()]
+        count = rows["count"].astype(np.float64)
+        samples = count + rows["outside"]
+        in_range = count > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(rows["mean"] * count) / count.sum()
+            # pooled variance of the in-range samples
+            squares = (rows["std"].astype(np.float64) ** 2 + rows["mean"] ** 2) * count
+            std = np.sqrt(max(np.nansum(squares) / count.sum() - mean * mean, 0))
+            outside = rows["outside"] / samples
+        table.append(
+            {
+                "channel": channel,
+                "seconds": len(rows),
+                "mean": mean,
+                "std": std,
+                "min": rows["min"][in_range].min() if in_range.any() else np.nan,
+                "max": rows["max"][in_range].max() if in_range.any() else np.nan,
+                "outside": rows["outside"].sum() / samples.sum() if len(rows) else 0,
+                "dead": np.mean(~in_range | (rows["std"] < min_std)) if len(rows) else 0,
+                "saturated": np.mean(outside > max_outside) if len(rows) else 0,
+            }
+        )
+    columns = [
+        "channel",
+        "seconds",
+        "mean",
+        "std",
+        "min",
+        "max",
+        "outside",
+        "dead",
+        "saturated",
+    ]
+    return pd.DataFrame(table, columns=columns).set_index("channel")
+
+
+def run(parser, args):
+    """Print the quality table of a bulk file's channels as tab separated text"""
+    bulk_path = Path(args.bulkfile).expanduser()
+    if not bulk_path.is_file():
+        die(f"Could not open {bulk_path}")
+    sidecar = open_sidecar(bulk_path)
+    if sidecar is None:
+        die(f"No current index for {bulk_path}, run 'bulkvis index {args.bulkfile}'")
+    try:
+        channels = parse_channels(args.channels) if args.channels else None
+    except ValueError as e:
+        die(str(e))
+    with sidecar:
+        table = channel_quality(sidecar, channels, args.min_std, args.max_outside)
+    if table.empty:
+        die(
+            f"The index of {bulk_path} has no signal statistics, rebuild it with "
+            f"'bulkvis index --force {args.bulkfile}'"
+        )
+    table.to_csv(sys.stdout, sep="\t", float_format="%.4g")
+
+
+if __name__ == "__main__":
+    sys.exit("ERROR: stats is not directly executable")